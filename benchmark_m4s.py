@@ -0,0 +1,69 @@
+'''
+Description: m4s音视频合并的性能基准：对比直接拼接分片与调用 ffmpeg 的耗时
+'''
+import os
+import time
+import argparse
+import tempfile
+import subprocess
+
+from fmp4 import probe_file
+from m4s_to_mp4 import build_merge_command, remux_m4s_native
+
+# 生成分片MP4的参数，与哔哩哔哩的DASH分片相同：每个关键帧一个片段，moov 中不含样本
+_FRAGMENT_FLAGS = ['-f', 'mp4', '-movflags', 'frag_keyframe+empty_moov+default_base_moof']
+
+def make_m4s_pair(directory, seconds=60, bitrate='4M'):
+    """用 ffmpeg 生成一对测试用的视频、音频m4s文件（H.264 + AAC）"""
+    video_m4s = os.path.join(directory, 'video.m4s')
+    audio_m4s = os.path.join(directory, 'audio.m4s')
+    subprocess.run(['ffmpeg', '-y', '-f', 'lavfi', '-i', f'testsrc2=size=1280x720:rate=30:duration={seconds}',
+                    '-c:v', 'libx264', '-preset', 'ultrafast', '-b:v', bitrate, '-g', '60', '-an',
+                    *_FRAGMENT_FLAGS, video_m4s], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    subprocess.run(['ffmpeg', '-y', '-f', 'lavfi', '-i', f'anoisesrc=duration={seconds}',
+                    '-c:a', 'aac', '-b:a', '192k', *_FRAGMENT_FLAGS, audio_m4s],
+                   check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return video_m4s, audio_m4s
+
+def merge_with_ffmpeg(video_m4s, audio_m4s, output_file):
+    subprocess.run(build_merge_command(video_m4s, audio_m4s, output_file), check=True,
+                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return output_file
+
+def time_call(func, *args, repeat=3):
+    """返回多次运行中的最短耗时（秒）"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def run_benchmark(durations=(30, 120, 480), bitrate='4M'):
+    """视频时长逐次增加，对比两种合并方式的耗时和吞吐量"""
+    print(f"{'时长(s)':>8} {'大小(MB)':>10} {'ffmpeg(s)':>10} {'直接拼接(s)':>12} {'加速':>8} {'吞吐(MB/s)':>12}")
+    for seconds in durations:
+        with tempfile.TemporaryDirectory() as directory:
+            video_m4s, audio_m4s = make_m4s_pair(directory, seconds, bitrate)
+            size = (os.path.getsize(video_m4s) + os.path.getsize(audio_m4s)) / 1024 / 1024
+            ffmpeg_output = os.path.join(directory, 'ffmpeg.mp4')
+            native_output = os.path.join(directory, 'native.mp4')
+            ffmpeg_time = time_call(merge_with_ffmpeg, video_m4s, audio_m4s, ffmpeg_output)
+            native_time = time_call(remux_m4s_native, video_m4s, audio_m4s, native_output)
+
+            # 两种方式的输出都应包含一个视频轨道和一个音频轨道
+            for output in (ffmpeg_output, native_output):
+                handlers = sorted(track['handler'] for track in probe_file(output)['tracks'])
+                assert handlers == ['soun', 'vide'], (output, handlers)
+        print(f"{seconds:>8} {size:>10.1f} {ffmpeg_time:>10.3f} {native_time:>12.3f} "
+              f"{ffmpeg_time / native_time:>7.1f}x {size / native_time:>12.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description='m4s音视频合并的性能基准')
+    parser.add_argument('--durations', type=int, nargs='+', default=[30, 120, 480], help='测试视频的时长（秒）')
+    parser.add_argument('--bitrate', default='4M', help='测试视频的码率')
+    args = parser.parse_args()
+    run_benchmark(args.durations, args.bitrate)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+'''
+Description: PDF增强流水线的性能基准：生成合成的扫描件PDF，统计增强页数/秒、MB/页和各阶段耗时
+'''
+import os
+import json
+import argparse
+import tempfile
+
+import fitz  # PyMuPDF
+import cv2
+import numpy as np
+
+from pdfEnhancedQuality import PROFILE_STAGES, enhance_pdf_clarity
+
+# A4 页面尺寸（pt）
+_PAGE_WIDTH, _PAGE_HEIGHT = 595, 842
+
+def make_scanned_image(width, height, color=False, noise=8.0, rng=None):
+    """
+    生成一张模拟扫描的页面图像（BGR）：泛黄的纸张、多行文字、轻微模糊和高斯噪声；
+    color 为 False 时返回灰度图像
+    """
+    rng = rng or np.random.default_rng(0)
+    paper = (225, 240, 245) if color else (235, 235, 235)
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    img[:] = paper
+
+    scale = width / 1700
+    margin = int(120 * scale)
+    line_height = int(48 * scale)
+    if color:
+        # 彩色页加一个色块标题和一幅插图
+        cv2.rectangle(img, (margin, margin), (width - margin, margin + 2 * line_height), (170, 90, 30), -1)
+        cv2.circle(img, (width * 3 // 4, height // 2), width // 8, (60, 140, 220), -1)
+    y = margin + 3 * line_height
+    while y < height - margin:
+        words = rng.integers(3, 12, size=int(rng.integers(6, 12)))
+        text = ' '.join('x' * int(n) for n in words)
+        cv2.putText(img, f'{y // line_height} {text}', (margin, y), cv2.FONT_HERSHEY_SIMPLEX, 1.1 * scale,
+                    (30, 30, 30), max(1, int(2 * scale)), cv2.LINE_AA)
+        y += line_height
+
+    img = cv2.GaussianBlur(img, (3, 3), 0)
+    noisy = img.astype(np.float32) + rng.normal(0, noise, img.shape).astype(np.float32)
+    img = np.clip(noisy, 0, 255).astype(np.uint8)
+    return img if color else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+def make_scanned_pdf(path, page_count=10, scan_dpi=200, color=False, noise=8.0, seed=0):
+    """生成 page_count 页的扫描件PDF，每页是一张按 scan_dpi 铺满页面的JPEG图像"""
+    rng = np.random.default_rng(seed)
+    width = int(_PAGE_WIDTH / 72 * scan_dpi)
+    height = int(_PAGE_HEIGHT / 72 * scan_dpi)
+    with fitz.open() as pdf:
+        for _ in range(page_count):
+            img = make_scanned_image(width, height, color, noise, rng)
+            ok, data = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 80])
+            page = pdf.new_page(width=_PAGE_WIDTH, height=_PAGE_HEIGHT)
+            page.insert_image(page.rect, stream=data.tobytes())
+        pdf.save(path)
+    return path
+
+def run_case(directory, name, page_count, color, scan_dpi, **options):
+    """生成一份合成PDF并增强，返回性能报告"""
+    input_path = os.path.join(directory, f'{name}.pdf')
+    make_scanned_pdf(input_path, page_count, scan_dpi, color)
+    report_path = os.path.join(directory, f'{name}.json')
+    enhance_pdf_clarity(input_path, os.path.join(directory, f'{name}_enhanced.pdf'), profile=report_path,
+                        checkpoint_dir=os.path.join(directory, f'{name}.checkpoint'), **options)
+    with open(report_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+# 各样本的 (名称, 是否彩色, 去噪档位)；合成扫描件的噪声较小，auto 会判为不去噪，因此固定档位
+BENCHMARK_CASES = (('gray', False, 'gray'), ('color', True, 'color'))
+
+def run_benchmark(page_count=10, scan_dpi=200, workers=1, encoding='png', denoise=None):
+    """
+    分别对灰度和彩色扫描件运行增强流水线，打印结果并返回 {名称: 报告}；
+    denoise 为 None 时每个样本使用 BENCHMARK_CASES 中的去噪档位
+    """
+    reports = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, color, tier in BENCHMARK_CASES:
+            reports[name] = run_case(directory, name, page_count, color, scan_dpi, workers=workers,
+                                     encoding=encoding, denoise=denoise or tier)
+
+    print(f"{'样本':>6} {'增强页/秒':>8} {'MB/页':>8} {'峰值MB':>8} " + ' '.join(f'{s:>8}' for s in PROFILE_STAGES))
+    for name, report in reports.items():
+        stages = ' '.join(f"{report['stage_seconds'].get(s, 0):>8.2f}" for s in PROFILE_STAGES)
+        print(f"{name:>6} {report['enhanced_pages_per_second']:>8.2f} {report['mb_per_page']:>8.3f} "
+              f"{report['peak_rss_mb'] or 0:>8.0f} {stages}")
+    return reports
+
+def compare_with_baseline(reports, baseline, tolerance=0.1):
+    """
+    与基线结果比较，增强页数/秒下降或 MB/页增加超过 tolerance 比例时视为性能回退
+
+    返回:
+        list: 回退项的说明，没有回退时为空列表
+    """
+    regressions = []
+    for name, report in reports.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]
+        if report['enhanced_pages_per_second'] < old['enhanced_pages_per_second'] * (1 - tolerance):
+            regressions.append(f"{name}: 增强页/秒 {old['enhanced_pages_per_second']:.2f} -> "
+                               f"{report['enhanced_pages_per_second']:.2f}")
+        if report['mb_per_page'] > old['mb_per_page'] * (1 + tolerance):
+            regressions.append(f"{name}: MB/页 {old['mb_per_page']:.3f} -> {report['mb_per_page']:.3f}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='PDF增强流水线的性能基准')
+    parser.add_argument('--pages', type=int, default=10, help='每份合成PDF的页数')
+    parser.add_argument('--scan-dpi', type=int, default=200, help='合成扫描图像的分辨率')
+    parser.add_argument('-j', '--workers', type=int, default=1, help='并行进程数，0 表示使用全部CPU核')
+    parser.add_argument('-e', '--encoding', default='png', help='输出图像的编码方式')
+    parser.add_argument('--denoise', help='所有样本使用同一去噪档位，默认灰度样本用 gray、彩色样本用 color')
+    parser.add_argument('--save', metavar='BASELINE.json', help='把本次结果保存为基线')
+    parser.add_argument('--baseline', metavar='BASELINE.json', help='与基线比较，出现回退时返回非零状态')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='允许的波动比例')
+    args = parser.parse_args()
+
+    reports = run_benchmark(args.pages, args.scan_dpi, args.workers or None, args.encoding, args.denoise)
+    summary = {name: {'enhanced_pages_per_second': r['enhanced_pages_per_second'], 'mb_per_page': r['mb_per_page']}
+               for name, r in reports.items()}
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=1)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare_with_baseline(summary, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"性能回退: {line}")
+        if regressions:
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+'''
+Description: 折行合并算法的性能基准：对比旧的逐行拼接实现与线性时间实现
+'''
+import re
+import time
+
+from main import remove_unnecessary_line_breaks
+
+def legacy_remove_unnecessary_line_breaks(text):
+    """旧实现：每合并一行都把已累积的前缀重新复制一遍，长段落耗时为平方级"""
+    lines = text.splitlines()
+    processed_lines = []
+    i = 0
+    while i < len(lines):
+        if lines[i].strip():
+            if not re.search(r'[。！？，、；：,.!?;:]$', lines[i].rstrip()):
+                if i < len(lines) - 1:
+                    lines[i + 1] = lines[i].rstrip() + ' ' + lines[i + 1].lstrip()
+                else:
+                    processed_lines.append(lines[i].rstrip())
+            else:
+                processed_lines.append(lines[i].rstrip())
+        i += 1
+    return '\n'.join(processed_lines)
+
+def make_pathological_text(line_count):
+    """生成没有任何句末标点的文本（类似表格、公式或整页无句号的OCR结果）"""
+    return '\n'.join(f'第{i}行 卫生统计学 表格数据 {i * 7 % 1000}' for i in range(line_count))
+
+def time_call(func, text, repeat=3):
+    """返回多次运行中的最短耗时（秒）"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def run_benchmark(sizes=(1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000), legacy_limit=4000):
+    """
+    行数逐次翻倍。旧实现在长段落上同时占用平方级的时间和内存，只在 legacy_limit 行以内运行
+    """
+    print(f"{'行数':>8} {'旧实现(s)':>12} {'新实现(s)':>12} {'新实现增长':>10}")
+    previous = None
+    for size in sizes:
+        text = make_pathological_text(size)
+        linear = time_call(remove_unnecessary_line_breaks, text)
+        if size <= legacy_limit:
+            assert legacy_remove_unnecessary_line_breaks(text) == remove_unnecessary_line_breaks(text)
+            legacy = f"{time_call(legacy_remove_unnecessary_line_breaks, text, repeat=1):.4f}"
+        else:
+            legacy = '-'
+        growth = f"{linear / previous:.2f}x" if previous else '-'
+        print(f"{size:>8} {legacy:>12} {linear:>12.4f} {growth:>10}")
+        previous = linear
+    print("行数每翻一倍，线性实现的耗时应约为原来的2倍，旧实现约为4倍")
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -6,24 +6,299 @@ Description: some description
 FilePath: /PekingUniversityCode/PekingUniversityPublicHealth/main.py
 '''
 from docx import Document
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
+from collections import Counter, defaultdict
+from lxml import etree
+import argparse
 import re
+import zipfile
+from docx_stream import w, rewrite_docx, rewrite_xml_stream, iter_paragraph_content
+
+# 常见的页码格式，(名称, 正则表达式)；正则中的第一个分组为页码
+# 这些格式只有单独成段时才算页码，"见第12页"、"see page 12" 等正文中的引用不算
+PAGE_MARKER_FORMATS = [
+    ('第N页', r'第\s*(\d{1,4})\s*页(?:\s*[，,/]?\s*共\s*\d{1,4}\s*页)?'),
+    ('- N -', r'[-—–]\s*(\d{1,4})\s*[-—–]'),
+    ('Page N', r'(?i:page)\s*(\d{1,4})(?:\s*(?i:of)\s*\d{1,4})?'),
+]
+
+# N/总页数 格式，总页数在检测时确定，例如 12/578
+_FRACTION_PATTERN = re.compile(r'(?<!\d)(\d{1,4})\s*/\s*(\d{1,4})(?!\d)')
+
+# 检测到的页码在其范围内至少占多大比例，才认为是逐页出现的页码而不是零散的数字
+_MIN_SEQUENCE_DENSITY = 0.8
+# 样本覆盖整个文档时，N/总页数 中检测到的页码至少占总页数的比例
+_MIN_TOTAL_COVERAGE = 0.5
+# 总页数小于该值的 N/总页数 不检测，1/4、3/4 等普通分数很常见
+_MIN_FRACTION_TOTAL = 10
+
+def _is_page_sequence(numbers, min_count, total=None, complete=True):
+    """
+    判断一组数字是否像逐页出现的页码：数量足够，并且在其范围内基本连续；
+    给出总页数且样本覆盖整个文档时，还要覆盖总页数的大部分
+    """
+    if len(numbers) < min_count:
+        return False
+    if len(numbers) / (max(numbers) - min(numbers) + 1) < _MIN_SEQUENCE_DENSITY:
+        return False
+    if total is not None and complete and len(numbers) / total < _MIN_TOTAL_COVERAGE:
+        return False
+    return True
+
+def _whole_paragraph(pattern):
+    return rf'^\s*(?:{pattern})\s*$'
+
+def detect_page_markers(texts, min_count=3, min_repeats=10, max_header_length=40, running_headers=False,
+                        complete=True):
+    """
+    从样本文本中自动检测页码格式
+
+    参数:
+        texts (iterable): 样本段落文本（不应包含表格中的段落）
+        min_count (int): 页码格式至少对应多少个不同页码才认为是页码
+        min_repeats (int): 同一行（忽略数字）至少重复多少次才认为是页眉/页脚
+        max_header_length (int): 页眉/页脚的最大长度
+        running_headers (bool): 是否同时检测重复出现的短行和单独一行的数字；
+            这两种规则可能误删正文中的小标题、"合计"等内容，默认不启用
+        complete (bool): 样本是否覆盖了整个文档，为 False 时 N/总页数 不要求覆盖总页数的大部分
+
+    返回:
+        list: 正则表达式列表
+    """
+    numbers_by_format = defaultdict(set)
+    numerators_by_total = defaultdict(set)
+    bare_numbers = set()
+    header_counts = Counter()
+
+    for text in texts:
+        stripped = re.sub(r'\s+', ' ', text.strip())
+        for name, pattern in PAGE_MARKER_FORMATS:
+            match = re.fullmatch(pattern, stripped)
+            if match:
+                numbers_by_format[name].add(int(match.group(1)))
+        for match in _FRACTION_PATTERN.finditer(text):
+            numerator, total = int(match.group(1)), int(match.group(2))
+            if 0 < numerator <= total and total >= _MIN_FRACTION_TOTAL:
+                numerators_by_total[total].add(numerator)
+        if stripped.isdigit() and len(stripped) <= 4:
+            bare_numbers.add(int(stripped))
+        elif stripped and len(stripped) <= max_header_length:
+            header_counts[stripped] += 1
+
+    patterns = []
+    for total, numerators in numerators_by_total.items():
+        if _is_page_sequence(numerators, min_count, total, complete):
+            patterns.append(rf'(?<!\d)\d{{1,4}}\s*/\s*{total}(?!\d)')
+    for name, pattern in PAGE_MARKER_FORMATS:
+        if _is_page_sequence(numbers_by_format[name], min_count):
+            patterns.append(_whole_paragraph(pattern))
+
+    if not running_headers:
+        return patterns
+
+    # 单独一行的页码：数字也要基本连续
+    if _is_page_sequence(bare_numbers, max(min_count, min_repeats)):
+        patterns.append(r'^\s*\d{1,4}\s*$')
+    # 重复出现的整行（页眉、页脚）
+    detected = compile_page_markers(patterns) if patterns else None
+    for header, count in header_counts.items():
+        if count < min_repeats:
+            continue
+        if detected is not None and not detected.sub('', header).strip():
+            continue
+        patterns.append(r'^\s*' + r'\s*'.join(re.escape(word) for word in header.split(' ')) + r'\s*$')
+
+    return patterns
+
+def compile_page_markers(patterns):
+    """把所有页码格式编译成一个正则（多选分支），每段文本只需扫描一次"""
+    return re.compile('|'.join(f'(?:{pattern})' for pattern in patterns))
+
+def _in_table(p):
+    return next(p.iterancestors(qn('w:tbl')), None) is not None
+
+def iter_document_paragraphs(doc, tables=True):
+    """
+    遍历正文（含表格）、页眉和页脚中的所有段落，共享的页眉页脚只遍历一次；
+    tables 为 False 时跳过表格中的段落
+    """
+    parts = [(doc.element.body, doc._body)]
+    seen = set()
+    for section in doc.sections:
+        for header_footer in (section.header, section.first_page_header, section.even_page_header,
+                              section.footer, section.first_page_footer, section.even_page_footer):
+            if header_footer.is_linked_to_previous:
+                continue
+            element = header_footer._element
+            if id(element) not in seen:
+                seen.add(id(element))
+                parts.append((element, header_footer))
+    for element, parent in parts:
+        for p in element.iter(qn('w:p')):
+            if tables or not _in_table(p):
+                yield Paragraph(p, parent)
+
+def remove_page_numbers(input_file, output_file, patterns=None, sample_size=2000, running_headers=False,
+                        streaming=False):
+    """
+    删除Word文档中的页码
+
+    参数:
+        input_file (str): 输入文档路径
+        output_file (str): 输出文档路径
+        patterns (list, optional): 页码正则列表，不提供时从前 sample_size 个段落中自动检测
+        sample_size (int): 自动检测时使用的段落数
+        running_headers (bool): 自动检测时是否同时删除重复出现的短行和单独一行的数字（见 detect_page_markers）
+        streaming (bool): 为 True 时直接流式改写XML中的文本节点，保留原有格式
+
+    自动检测只使用表格以外的段落，避免把表格中的数字当作页码
+    """
+    if streaming:
+        return remove_page_numbers_streaming(input_file, output_file, patterns, sample_size, running_headers)
 
-def remove_page_numbers(input_file, output_file):
     doc = Document(input_file)
-    # 修改后的正则表达式，匹配数字/578，后面没有点号
-    pattern = r'\d+/578'
-    
-    # 处理所有段落
-    for paragraph in doc.paragraphs:
-        if re.search(pattern, paragraph.text):
-            # 替换匹配到的内容
-            new_text = re.sub(pattern, '', paragraph.text)
-            paragraph.text = new_text
-    
+
+    if patterns is None:
+        sample = []
+        for paragraph in iter_document_paragraphs(doc, tables=False):
+            sample.append(paragraph.text)
+            if len(sample) >= sample_size:
+                break
+        patterns = detect_page_markers(sample, running_headers=running_headers, complete=len(sample) < sample_size)
+        if not patterns:
+            print("未检测到页码格式，文档未修改")
+        for pattern in patterns:
+            print(f"检测到页码格式: {pattern}")
+
+    removed = 0
+    if patterns:
+        marker = compile_page_markers(patterns)
+        # 正文、表格、页眉、页脚一次遍历完成
+        for paragraph in iter_document_paragraphs(doc):
+            text = paragraph.text
+            new_text, count = marker.subn('', text)
+            if count:
+                paragraph.text = new_text
+                removed += count
+
     # 保存修改后的文档
     doc.save(output_file)
+    print(f"共删除 {removed} 处页码，已保存到: {output_file}")
+
+# 需要删除页码的部件：正文、页眉、页脚；值为段落、表格所在的层级
+_PAGE_PARTS = re.compile(r'word/(document|header\d*|footer\d*)\.xml')
+
+def _part_depth(name):
+    """document.xml 中段落位于 w:document/w:body 之下，页眉页脚中段落直接位于根元素之下"""
+    return 2 if name == 'word/document.xml' else 1
+
+def _iter_part_names(zip_file):
+    """正文在前，页眉页脚在后"""
+    names = [name for name in zip_file.namelist() if _PAGE_PARTS.fullmatch(name)]
+    return sorted(names, key=lambda name: name != 'word/document.xml')
+
+def _paragraph_text(paragraph):
+    return ''.join(elem.text or '' for elem in iter_paragraph_content(paragraph) if elem.tag == w('t'))
+
+def _sample_paragraph_texts(input_file, sample_size):
+    """流式读取表格以外的前 sample_size 个段落的文本，用于自动检测页码格式"""
+    sample = []
+    with zipfile.ZipFile(input_file) as zip_file:
+        for name in _iter_part_names(zip_file):
+            with zip_file.open(name) as src:
+                for _, paragraph in etree.iterparse(src, events=('end',), tag=w('p'), huge_tree=True):
+                    if next(paragraph.iterancestors(w('tbl')), None) is not None:
+                        continue
+                    sample.append(_paragraph_text(paragraph))
+                    if len(sample) >= sample_size:
+                        return sample
+    return sample
+
+def _strip_markers_in_paragraph(paragraph, marker):
+    """
+    在段落的 w:t 文本节点上直接删除页码，跨多个 run 的页码也能删除，
+    其他 run 和格式保持不变
+
+    返回:
+        int: 删除的页码数
+    """
+    nodes = [elem for elem in iter_paragraph_content(paragraph) if elem.tag == w('t')]
+    texts = [node.text or '' for node in nodes]
+    joined = ''.join(texts)
+    matches = [match.span() for match in marker.finditer(joined) if match.end() > match.start()]
+    if not matches:
+        return 0
+
+    offset = 0
+    for node, text in zip(nodes, texts):
+        start, end = offset, offset + len(text)
+        offset = end
+        kept = []
+        position = start
+        for match_start, match_end in matches:
+            if match_end <= start or match_start >= end:
+                continue
+            if match_start > position:
+                kept.append(joined[position:match_start])
+            position = max(position, min(match_end, end))
+        if position == start:
+            continue
+        kept.append(joined[position:end])
+        new_text = ''.join(kept)
+        node.text = new_text
+        if new_text != new_text.strip():
+            node.set('{http://www.w3.org/XML/1998/namespace}space', 'preserve')
+    return len(matches)
+
+def remove_page_numbers_streaming(input_file, output_file, patterns=None, sample_size=2000, running_headers=False):
+    """
+    流式删除Word文档中的页码，不使用 python-docx 对象模型
+
+    直接修改正文、表格、页眉、页脚中的 w:t 文本节点，run 的格式完整保留；
+    压缩包中其他成员原样复制，不重新压缩
+    """
+    if patterns is None:
+        sample = _sample_paragraph_texts(input_file, sample_size)
+        patterns = detect_page_markers(sample, running_headers=running_headers, complete=len(sample) < sample_size)
+        if not patterns:
+            print("未检测到页码格式，文档未修改")
+        for pattern in patterns:
+            print(f"检测到页码格式: {pattern}")
+
+    removed = 0
+    transforms = {}
+    if patterns:
+        marker = compile_page_markers(patterns)
+
+        def process(block):
+            nonlocal removed
+            for paragraph in list(block.iter(w('p'))):
+                removed += _strip_markers_in_paragraph(paragraph, marker)
+
+        def get_transform(name):
+            if not _PAGE_PARTS.fullmatch(name):
+                return None
+            return lambda src, dst: rewrite_xml_stream(src, dst, process, depth=_part_depth(name))
+
+        transforms = get_transform
+
+    rewrite_docx(input_file, output_file, transforms)
+    print(f"共删除 {removed} 处页码，已保存到: {output_file}")
+
+def main():
+    parser = argparse.ArgumentParser(description='删除Word文档中的页码')
+    parser.add_argument('input', nargs='?', default="./我的科研助理：GPT.docx", help='输入文档路径')
+    parser.add_argument('output', nargs='?', default="处理后文档.docx", help='输出文档路径')
+    parser.add_argument('-p', '--pattern', action='append', help=r'页码正则，可重复指定，例如 "\d+/578"；不指定时自动检测')
+    parser.add_argument('--sample-size', type=int, default=2000, help='自动检测时使用的段落数')
+    parser.add_argument('--running-headers', action='store_true',
+                        help='同时删除重复出现的短行和单独一行的数字（可能误删正文内容，默认不启用）')
+    parser.add_argument('-s', '--streaming', action='store_true', help='流式改写XML，保留原有格式，适合大文件')
+
+    args = parser.parse_args()
+    remove_page_numbers(args.input, args.output, args.pattern, args.sample_size, args.running_headers,
+                        args.streaming)
 
-# 使用示例
-input_file = "./我的科研助理：GPT.docx"  # 你的输入文件名
-output_file = "处理后文档.docx"  # 你想保存的文件名
-remove_page_numbers(input_file, output_file)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
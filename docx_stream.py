@@ -0,0 +1,158 @@
+'''
+Author: Diana Tang
+Date: 2026-10-17 14:36:05
+LastEditors: Diana Tang
+Description: 不经过 python-docx 对象模型，直接流式改写 .docx 压缩包中的XML部件
+FilePath: /PekingUniversityCode/PekingUniversityPublicHealth/docx_stream.py
+'''
+import os
+import copy
+import struct
+import zipfile
+from lxml import etree
+
+# WordprocessingML 命名空间
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+
+def w(tag):
+    """返回带命名空间的 WordprocessingML 标签名，例如 w('p')"""
+    return f'{{{W_NS}}}{tag}'
+
+# 本地文件头的固定长度（不含文件名和扩展字段）
+_LOCAL_HEADER_SIZE = 30
+_COPY_CHUNK_SIZE = 1024 * 1024
+
+def copy_member_raw(src_zip, dst_zip, info):
+    """
+    把压缩包成员的压缩数据原样复制到输出压缩包，不解压也不重新压缩
+    """
+    src_fp = src_zip.fp
+    src_fp.seek(info.header_offset)
+    header = src_fp.read(_LOCAL_HEADER_SIZE)
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    src_fp.seek(info.header_offset + _LOCAL_HEADER_SIZE + name_length + extra_length)
+
+    new_info = copy.copy(info)
+    # CRC和大小直接写在本地文件头中，不再需要数据描述符
+    new_info.flag_bits &= ~0x08
+    new_info.header_offset = dst_zip.fp.tell()
+    dst_zip.fp.write(new_info.FileHeader())
+
+    remaining = info.compress_size
+    while remaining > 0:
+        chunk = src_fp.read(min(_COPY_CHUNK_SIZE, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f"压缩包成员数据不完整: {info.filename}")
+        dst_zip.fp.write(chunk)
+        remaining -= len(chunk)
+
+    dst_zip.filelist.append(new_info)
+    dst_zip.NameToInfo[new_info.filename] = new_info
+    dst_zip.start_dir = dst_zip.fp.tell()
+    dst_zip._didModify = True
+
+def rewrite_docx(input_file, output_file, transforms):
+    """
+    改写 .docx 中的指定部件，其余成员逐字节原样复制
+
+    参数:
+        input_file (str): 输入 .docx 路径
+        output_file (str): 输出 .docx 路径
+        transforms (dict or callable): 部件名 -> transform(src, dst)，src、dst 为二进制文件对象；
+            也可以是 callable(部件名)，返回 transform 或 None（None 表示原样复制）
+
+    先写到输出目录中的临时文件，完成后再替换输出文件，输入和输出可以是同一个文件
+    """
+    if isinstance(transforms, dict):
+        transforms = transforms.get
+
+    temp_path = output_file + '.tmp'
+    try:
+        with zipfile.ZipFile(input_file) as src_zip, zipfile.ZipFile(temp_path, 'w') as dst_zip:
+            for info in src_zip.infolist():
+                transform = transforms(info.filename)
+                if transform is None:
+                    copy_member_raw(src_zip, dst_zip, info)
+                    continue
+                new_info = zipfile.ZipInfo(info.filename, info.date_time)
+                new_info.compress_type = zipfile.ZIP_DEFLATED
+                new_info.external_attr = info.external_attr
+                with src_zip.open(info) as src, dst_zip.open(new_info, 'w') as dst:
+                    transform(src, dst)
+        os.replace(temp_path, output_file)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def _namespace_declarations(nsmap):
+    """把 nsmap 转换为序列化后的 xmlns 声明"""
+    declarations = set()
+    for prefix, uri in nsmap.items():
+        uri = uri.replace('&', '&amp;').replace('"', '&quot;').replace('<', '&lt;')
+        if prefix is None:
+            declarations.add(f' xmlns="{uri}"'.encode('utf-8'))
+        else:
+            declarations.add(f' xmlns:{prefix}="{uri}"'.encode('utf-8'))
+    return declarations
+
+def _strip_inherited_declarations(data, inherited):
+    """
+    lxml 单独序列化子元素时会重复祖先元素的全部命名空间声明，
+    这里从第一个开始标签中去掉已经在祖先元素上声明过的部分
+    """
+    end = data.index(b'>')
+    start_tag = data[:end]
+    for declaration in inherited:
+        start_tag = start_tag.replace(declaration, b'', 1)
+    return start_tag + data[end:]
+
+def rewrite_xml_stream(src, dst, process, depth=1):
+    """
+    用 lxml iterparse 流式改写XML：第 depth 层元素解析完成后交给 process 处理，
+    随即写出并从内存中释放，峰值内存只取决于单个元素（段落、表格）的大小
+
+    参数:
+        src: 二进制输入文件对象
+        dst: 二进制输出文件对象
+        process (callable): process(element)，就地修改元素
+        depth (int): 处理单位所在的层级，根元素为 0；document.xml 中段落和表格位于第 2 层
+    """
+    dst.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\r\n')
+    level = -1
+    # 各层外层容器上生效的命名空间声明（含继承的），子元素序列化时去掉这些重复声明
+    in_scope = [set()]
+    for event, elem in etree.iterparse(src, events=('start', 'end'), huge_tree=True):
+        if event == 'start':
+            level += 1
+            if level < depth:
+                # 外层容器只写开始标签，结束时再写结束标签
+                shell = etree.Element(elem.tag, dict(elem.attrib), nsmap=elem.nsmap)
+                data = _strip_inherited_declarations(etree.tostring(shell), in_scope[-1])
+                dst.write(data[:-2] + b'>')
+                in_scope.append(_namespace_declarations(elem.nsmap))
+            continue
+
+        if level == depth:
+            process(elem)
+            data = etree.tostring(elem, encoding='utf-8', xml_declaration=False)
+            dst.write(_strip_inherited_declarations(data, in_scope[-1]))
+            parent = elem.getparent()
+            elem.clear()
+            if parent is not None:
+                parent.remove(elem)
+        elif level < depth:
+            in_scope.pop()
+            qname = etree.QName(elem)
+            prefix = f'{elem.prefix}:' if elem.prefix else ''
+            dst.write(f'</{prefix}{qname.localname}>'.encode('utf-8'))
+        level -= 1
+
+def iter_paragraph_content(paragraph):
+    """按文档顺序遍历段落中的元素，不进入嵌套段落（如文本框中的段落）"""
+    stack = list(reversed(paragraph))
+    while stack:
+        elem = stack.pop()
+        if elem.tag == w('p'):
+            continue
+        yield elem
+        stack.extend(reversed(elem))
@@ -0,0 +1,476 @@
+'''
+Author: Diana Tang
+Date: 2026-10-17 17:05:12
+LastEditors: Diana Tang
+Description: 轻量的 ISO-BMFF（MP4/m4s）盒子解析，只读取文件头部的 ftyp/moov 等结构，用 mmap 访问文件
+FilePath: /PekingUniversityCode/PekingUniversityPublicHealth/fmp4.py
+'''
+import os
+import sys
+import mmap
+import errno
+import heapq
+import struct
+
+# 在文件开头多少字节内查找 ftyp；哔哩哔哩客户端缓存的m4s前面会多出若干个 '0'
+_MAX_LEADING_JUNK = 64
+
+# MP4 中 objectTypeIndication 为 0x40 或 0x66-0x68 的音频是AAC
+_AAC_OBJECT_TYPES = {0x40, 0x66, 0x67, 0x68}
+
+def iter_boxes(buf, start=0, end=None):
+    """
+    逐个产出 [start, end) 范围内的盒子
+
+    产出:
+        tuple: (类型, 盒子起始偏移, 头部长度, 盒子总长度)，类型为4字节的 bytes
+    """
+    end = len(buf) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', buf, offset)
+        header = 8
+        if size == 1:
+            if offset + 16 > end:
+                return
+            size = struct.unpack_from('>Q', buf, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            # 最后一个盒子延伸到文件末尾
+            size = end - offset
+        if size < header or offset + size > end:
+            # 盒子不完整（文件被截断），只产出头部信息
+            yield box_type, offset, header, end - offset
+            return
+        yield box_type, offset, header, size
+        offset += size
+
+def find_box(buf, path, start=0, end=None):
+    """按路径（例如 [b'mdia', b'hdlr']）查找第一个匹配的盒子，返回 (内容起始, 内容结束) 或 None"""
+    for box_type, offset, header, size in iter_boxes(buf, start, end):
+        if box_type == path[0]:
+            if len(path) == 1:
+                return offset + header, offset + size
+            return find_box(buf, path[1:], offset + header, offset + size)
+    return None
+
+def _parse_esds(buf, start, end):
+    """从 esds 的 ES_Descriptor 中取出 DecoderConfigDescriptor 的 objectTypeIndication"""
+    offset = start + 4  # version + flags
+
+    def read_descriptor(offset):
+        tag = buf[offset]
+        offset += 1
+        length = 0
+        for _ in range(4):
+            byte = buf[offset]
+            offset += 1
+            length = (length << 7) | (byte & 0x7f)
+            if not byte & 0x80:
+                break
+        return tag, offset, length
+
+    tag, offset, _ = read_descriptor(offset)
+    if tag != 0x03:
+        return None
+    flags = buf[offset + 2]
+    offset += 3
+    if flags & 0x80:
+        offset += 2
+    if flags & 0x40:
+        offset += 1 + buf[offset]
+    if flags & 0x20:
+        offset += 2
+    if offset >= end:
+        return None
+    tag, offset, _ = read_descriptor(offset)
+    return buf[offset] if tag == 0x04 and offset < end else None
+
+def _parse_trak(buf, start, end):
+    """解析一个 trak：轨道号、类型（hdlr）、时间刻度（mdhd）和编码（stsd 的第一个样本描述）"""
+    track = {'track_id': None, 'handler': None, 'codec': None, 'timescale': None, 'object_type': None}
+
+    tkhd = find_box(buf, [b'tkhd'], start, end)
+    if tkhd:
+        version = buf[tkhd[0]]
+        track['track_id'] = struct.unpack_from('>I', buf, tkhd[0] + (20 if version == 1 else 12))[0]
+
+    mdhd = find_box(buf, [b'mdia', b'mdhd'], start, end)
+    if mdhd:
+        version = buf[mdhd[0]]
+        track['timescale'] = struct.unpack_from('>I', buf, mdhd[0] + (20 if version == 1 else 12))[0]
+
+    hdlr = find_box(buf, [b'mdia', b'hdlr'], start, end)
+    if hdlr:
+        track['handler'] = bytes(buf[hdlr[0] + 8:hdlr[0] + 12]).decode('latin-1')
+
+    stsd = find_box(buf, [b'mdia', b'minf', b'stbl', b'stsd'], start, end)
+    if stsd and stsd[1] - stsd[0] >= 16:
+        entry_size, codec = struct.unpack_from('>I4s', buf, stsd[0] + 8)
+        track['codec'] = codec.decode('latin-1')
+        if codec == b'mp4a':
+            # AudioSampleEntry 的固定字段共28字节，之后是 esds 等子盒子
+            entry_start = stsd[0] + 8
+            esds = find_box(buf, [b'esds'], entry_start + 36, min(entry_start + entry_size, stsd[1]))
+            if esds:
+                track['object_type'] = _parse_esds(buf, *esds)
+    return track
+
+def find_start_offset(buf):
+    """返回第一个盒子（ftyp）在文件中的偏移；前面有多余字节时不为0，找不到时返回 None"""
+    position = bytes(buf[:_MAX_LEADING_JUNK + 8]).find(b'ftyp')
+    if position < 4:
+        return None
+    return position - 4
+
+def probe_buffer(buf):
+    """
+    解析已经映射到内存的文件，见 probe_file
+    """
+    start = find_start_offset(buf)
+    if start is None:
+        return None
+
+    info = {'offset': start, 'brands': [], 'tracks': [], 'fragmented': False,
+            'moov': None, 'fragments_offset': None}
+    for box_type, offset, header, size in iter_boxes(buf, start):
+        body = offset + header
+        if box_type == b'ftyp':
+            info['brands'] = [bytes(buf[i:i + 4]).decode('latin-1') for i in range(body, offset + size, 4)
+                              if i != body + 4]
+        elif box_type == b'moov':
+            info['moov'] = (offset, header, size)
+            for child_type, child_offset, child_header, child_size in iter_boxes(buf, body, offset + size):
+                if child_type == b'trak':
+                    info['tracks'].append(_parse_trak(buf, child_offset + child_header, child_offset + child_size))
+                elif child_type == b'mvex':
+                    info['fragmented'] = True
+        elif box_type == b'moof':
+            info['fragmented'] = True
+            info['fragments_offset'] = offset
+            # 只需要文件头部的信息，第一个片段之后不再向下遍历
+            break
+    return info
+
+def probe_file(path):
+    """
+    读取m4s/MP4文件头部的盒子结构，识别各轨道的类型和编码，不读取媒体数据
+
+    返回:
+        dict: offset 第一个盒子的偏移（前面有多余字节时不为0），brands 兼容品牌，
+              tracks 各轨道的 track_id、handler（'vide'/'soun'）、codec（例如 'avc1'、'mp4a'）、
+              timescale 和 object_type（AAC 为 0x40），fragmented 是否为分片MP4，
+              moov 为 (偏移, 头部长度, 长度)，fragments_offset 为第一个 moof 的偏移；
+              不是 ISO-BMFF 文件或头部损坏时返回 None
+    """
+    with open(path, 'rb') as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # 空文件无法映射
+            return None
+        with buf:
+            try:
+                return probe_buffer(buf)
+            except (struct.error, IndexError):
+                # 头部结构损坏
+                return None
+
+# 缺少 ftyp 的MP4片段开头可能出现的顶层盒子
+_HEADERLESS_BOXES = {b'moov', b'moof', b'sidx', b'styp', b'mdat', b'free'}
+
+def is_headerless_fragment(path):
+    """文件没有 ftyp，但开头是 moov、moof 等MP4顶层盒子（缺少头部的片段）"""
+    with open(path, 'rb') as f:
+        head = f.read(8)
+    return len(head) == 8 and head[4:8] in _HEADERLESS_BOXES
+
+def track_of(info, handler):
+    """返回第一个指定类型（'vide' 或 'soun'）的轨道，没有时返回 None"""
+    if not info:
+        return None
+    for track in info['tracks']:
+        if track['handler'] == handler:
+            return track
+    return None
+
+def is_aac(track):
+    """轨道是否为AAC音频"""
+    return bool(track) and track['codec'] == 'mp4a' and track['object_type'] in (_AAC_OBJECT_TYPES | {None})
+
+# 内核复制失败时改用下一种方式的错误码：不支持该系统调用、跨文件系统、参数或文件类型不支持
+_FALLBACK_ERRNOS = {errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP,
+                    errno.EBADF, errno.ESPIPE}
+_COPY_CHUNK_SIZE = 1024 * 1024
+
+def _copy_file_range(src_fd, dst_fd, offset, length):
+    while length > 0:
+        copied = os.copy_file_range(src_fd, dst_fd, min(length, 1 << 30), offset)
+        if copied == 0:
+            break
+        offset += copied
+        length -= copied
+    return offset, length
+
+def _sendfile(src_fd, dst_fd, offset, length):
+    while length > 0:
+        sent = os.sendfile(dst_fd, src_fd, offset, min(length, 1 << 30))
+        if sent == 0:
+            break
+        offset += sent
+        length -= sent
+    return offset, length
+
+def _read_write(src_fd, dst_fd, offset, length):
+    os.lseek(src_fd, offset, os.SEEK_SET)
+    while length > 0:
+        chunk = os.read(src_fd, min(length, _COPY_CHUNK_SIZE))
+        if not chunk:
+            break
+        view = memoryview(chunk)
+        while view:
+            view = view[os.write(dst_fd, view):]
+        offset += len(chunk)
+        length -= len(chunk)
+    return offset, length
+
+# 依次尝试的复制方式，前两种由内核完成，数据不经过Python进程的内存
+_COPY_METHODS = [method for name, method in (('copy_file_range', _copy_file_range), ('sendfile', _sendfile))
+                 if hasattr(os, name)] + [_read_write]
+
+def copy_range(src_fd, dst_fd, offset, length):
+    """
+    把 src_fd 中从 offset 开始的 length 字节追加到 dst_fd 的当前位置
+
+    优先使用 copy_file_range，其次 sendfile，系统不支持时才按块读写
+    """
+    for method in _COPY_METHODS:
+        try:
+            offset, length = method(src_fd, dst_fd, offset, length)
+        except OSError as e:
+            if e.errno not in _FALLBACK_ERRNOS:
+                raise
+            continue
+        if length == 0:
+            return
+        break
+    raise OSError(f"源文件提前结束，还有 {length} 字节未复制")
+
+# Linux 的 FICLONE ioctl：在支持的文件系统（Btrfs、XFS 等）上让两个文件共享数据块
+_FICLONE = 0x40049409
+
+def _reflink(src_fd, dst_fd):
+    """尝试用 reflink 克隆整个文件，不支持时返回 False"""
+    if not sys.platform.startswith('linux'):
+        return False
+    try:
+        import fcntl
+        fcntl.ioctl(dst_fd, _FICLONE, src_fd)
+    except (ImportError, OSError):
+        return False
+    return True
+
+def copy_file(src_path, dst_path, offset=0):
+    """
+    复制文件中从 offset 开始的内容，不把文件读入内存
+
+    从头复制时先尝试 reflink（不复制数据），否则由 copy_range 在内核中复制
+    """
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        if offset == 0 and _reflink(src.fileno(), dst.fileno()):
+            return dst_path
+        size = os.fstat(src.fileno()).st_size
+        copy_range(src.fileno(), dst.fileno(), offset, size - offset)
+    return dst_path
+
+def _box(box_type, payload):
+    """生成一个盒子；内容超过4GB时使用64位长度"""
+    if len(payload) + 8 > 0xffffffff:
+        return struct.pack('>I4sQ', 1, box_type, len(payload) + 16) + payload
+    return struct.pack('>I4s', len(payload) + 8, box_type) + payload
+
+def _rebuild(data, start, end, transform):
+    """
+    重建 [start, end) 范围内的子盒子：transform(类型, 盒子内容) 返回新的盒子内容，
+    返回 None 表示删除该盒子
+    """
+    parts = []
+    for box_type, offset, header, size in iter_boxes(data, start, end):
+        payload = transform(box_type, bytes(data[offset + header:offset + size]))
+        if payload is not None:
+            parts.append(_box(box_type, payload))
+    return b''.join(parts)
+
+def _scale(value, scale):
+    return int(round(value * scale))
+
+def _patch_tkhd(payload, track_id, scale):
+    """修改 tkhd 的轨道号，时长按电影时间刻度换算"""
+    payload = bytearray(payload)
+    if payload[0] == 1:
+        struct.pack_into('>I', payload, 20, track_id)
+        duration = struct.unpack_from('>Q', payload, 28)[0]
+        if duration != 0xffffffffffffffff:
+            struct.pack_into('>Q', payload, 28, _scale(duration, scale))
+    else:
+        struct.pack_into('>I', payload, 12, track_id)
+        duration = struct.unpack_from('>I', payload, 20)[0]
+        if duration != 0xffffffff:
+            struct.pack_into('>I', payload, 20, min(_scale(duration, scale), 0xfffffffe))
+    return bytes(payload)
+
+def _patch_elst(payload, scale):
+    """编辑列表中的片段时长以电影时间刻度为单位，按新的刻度换算；媒体时间不变"""
+    payload = bytearray(payload)
+    version = payload[0]
+    entry_count = struct.unpack_from('>I', payload, 4)[0]
+    entry_format, entry_size = ('>Q', 20) if version == 1 else ('>I', 12)
+    for i in range(entry_count):
+        offset = 8 + i * entry_size
+        duration = struct.unpack_from(entry_format, payload, offset)[0]
+        struct.pack_into(entry_format, payload, offset, _scale(duration, scale))
+    return bytes(payload)
+
+def _merged_trak(trak, track_id, scale):
+    def transform(box_type, payload):
+        if box_type == b'tkhd':
+            return _patch_tkhd(payload, track_id, scale)
+        if box_type == b'edts':
+            return _rebuild(payload, 0, len(payload),
+                            lambda t, p: _patch_elst(p, scale) if t == b'elst' else p)
+        return payload
+    return _rebuild(trak, 0, len(trak), transform)
+
+def _movie_timescale(moov):
+    mvhd = find_box(moov, [b'mvhd'])
+    return struct.unpack_from('>I', moov, mvhd[0] + (20 if moov[mvhd[0]] == 1 else 12))[0]
+
+def merge_moov(video_moov, audio_moov):
+    """
+    合并两个只有一个轨道的初始化段的 moov（不含盒子头部）：视频轨道编号为1，音频轨道编号为2，
+    mvhd 和 mvex 中的其余内容取自视频文件，音频轨道的时长换算为视频文件的电影时间刻度
+    """
+    video_scale = _movie_timescale(video_moov)
+    audio_scale = video_scale / _movie_timescale(audio_moov)
+    trex = {}
+    for track_id, moov in ((1, video_moov), (2, audio_moov)):
+        body = find_box(moov, [b'mvex', b'trex'])
+        if body is None:
+            raise ValueError("初始化段中没有 trex，不是分片MP4")
+        payload = bytearray(moov[body[0]:body[1]])
+        struct.pack_into('>I', payload, 4, track_id)
+        trex[track_id] = _box(b'trex', bytes(payload))
+    audio_trak = find_box(audio_moov, [b'trak'])
+    audio_trak = _box(b'trak', _merged_trak(audio_moov[audio_trak[0]:audio_trak[1]], 2, audio_scale))
+
+    parts = []
+    for box_type, offset, header, size in iter_boxes(video_moov):
+        payload = bytes(video_moov[offset + header:offset + size])
+        if box_type == b'mvhd':
+            payload = bytearray(payload)
+            # mvhd 的最后4字节为下一个可用的轨道号
+            struct.pack_into('>I', payload, len(payload) - 4, 3)
+            payload = bytes(payload)
+        elif box_type == b'trak':
+            payload = _merged_trak(payload, 1, 1.0)
+        elif box_type == b'mvex':
+            # 音频轨道放在视频轨道之后、mvex 之前；原有的 trex 换成两个轨道各自的 trex，mehd 等保留
+            parts.append(audio_trak)
+            payload = _rebuild(payload, 0, len(payload), lambda t, p: None if t == b'trex' else p)
+            payload += trex[1] + trex[2]
+        parts.append(_box(box_type, payload))
+    return _box(b'moov', b''.join(parts))
+
+def iter_fragments(buf, start, timescale):
+    """
+    产出文件中的各个片段：(解码时间秒数, moof 偏移, moof 长度, mdat 偏移, mdat 长度)
+
+    sidx、styp 等其他顶层盒子跳过；没有 tfdt 时沿用上一个片段的时间
+    """
+    moof = None
+    decode_time = 0.0
+    for box_type, offset, header, size in iter_boxes(buf, start):
+        if box_type == b'moof':
+            moof = (offset, size)
+            tfdt = find_box(buf, [b'traf', b'tfdt'], offset + header, offset + size)
+            if tfdt:
+                time_format = '>Q' if buf[tfdt[0]] == 1 else '>I'
+                decode_time = struct.unpack_from(time_format, buf, tfdt[0] + 4)[0] / timescale
+        elif box_type == b'mdat' and moof is not None:
+            yield decode_time, moof[0], moof[1], offset, size
+            moof = None
+
+def patch_moof(moof, sequence_number, track_id, offset_delta):
+    """
+    修改 moof 中的片段序号和轨道号；tfhd 中写明了绝对的 base_data_offset 时按新位置调整。
+    只改写固定长度的字段，moof 的长度不变
+    """
+    moof = bytearray(moof)
+    for box_type, offset, header, size in iter_boxes(moof, 8):
+        body = offset + header
+        if box_type == b'mfhd':
+            struct.pack_into('>I', moof, body + 4, sequence_number)
+        elif box_type == b'traf':
+            tfhd = find_box(moof, [b'tfhd'], body, offset + size)
+            if tfhd is None:
+                continue
+            flags = struct.unpack_from('>I', moof, tfhd[0])[0] & 0xffffff
+            struct.pack_into('>I', moof, tfhd[0] + 4, track_id)
+            if flags & 0x000001:
+                base = struct.unpack_from('>Q', moof, tfhd[0] + 8)[0]
+                struct.pack_into('>Q', moof, tfhd[0] + 8, base + offset_delta)
+    return bytes(moof)
+
+def _source_fragments(track_id, source, buf, info):
+    """给 iter_fragments 的结果加上输出轨道号和来源文件，供按解码时间归并"""
+    for time, *ranges in iter_fragments(buf, info['fragments_offset'], info['tracks'][0]['timescale']):
+        yield (time, track_id, source, buf, *ranges)
+
+def remux_fragmented(video_path, audio_path, output_path):
+    """
+    不经过 ffmpeg，把视频和音频两个单轨道的分片MP4（m4s）合并为一个分片MP4
+
+    由两个初始化段生成合并后的 moov，再按解码时间交错写出两个文件的 moof/mdat 片段：
+    moof 在内存中改写序号和轨道号，mdat 按字节范围由内核直接复制（copy_file_range/sendfile），
+    媒体数据不经过Python进程的内存
+    """
+    with open(video_path, 'rb') as video_file, open(audio_path, 'rb') as audio_file:
+        with mmap.mmap(video_file.fileno(), 0, access=mmap.ACCESS_READ) as video_buf, \
+                mmap.mmap(audio_file.fileno(), 0, access=mmap.ACCESS_READ) as audio_buf:
+            sources = []
+            for track_id, source, buf in ((1, video_file, video_buf), (2, audio_file, audio_buf)):
+                info = probe_buffer(buf)
+                if not info or not info['fragmented'] or info['moov'] is None or len(info['tracks']) != 1:
+                    raise ValueError(f"不是单轨道的分片MP4: {source.name}")
+                if info['fragments_offset'] is None:
+                    raise ValueError(f"没有找到媒体片段: {source.name}")
+                sources.append((track_id, source, buf, info))
+
+            (_, _, video_buf, video_info), (_, _, audio_buf, audio_info) = sources
+            ftyp = find_box(video_buf, [b'ftyp'], video_info['offset'])
+            # moov 可能使用64位长度，头部为16字节
+            moov_offset, moov_header, moov_size = video_info['moov']
+            video_moov = video_buf[moov_offset + moov_header:moov_offset + moov_size]
+            moov_offset, moov_header, moov_size = audio_info['moov']
+            audio_moov = audio_buf[moov_offset + moov_header:moov_offset + moov_size]
+            header = _box(b'ftyp', video_buf[ftyp[0]:ftyp[1]]) + merge_moov(video_moov, audio_moov)
+
+            fragments = [_source_fragments(*source) for source in sources]
+
+            with open(output_path, 'wb', buffering=0) as output:
+                output.write(header)
+                position = len(header)
+                sequence_number = 0
+                for _, track_id, source, buf, moof_offset, moof_size, mdat_offset, mdat_size in heapq.merge(
+                        *fragments, key=lambda fragment: fragment[0]):
+                    sequence_number += 1
+                    moof = patch_moof(buf[moof_offset:moof_offset + moof_size], sequence_number, track_id,
+                                      position - moof_offset)
+                    output.write(moof)
+                    # moof 与 mdat 之间可能还有其他盒子，保持 mdat 相对 moof 的位置，base_data_offset 才正确
+                    gap = mdat_offset - moof_offset - moof_size
+                    if gap:
+                        output.write(buf[moof_offset + moof_size:mdat_offset])
+                    copy_range(source.fileno(), output.fileno(), mdat_offset, mdat_size)
+                    position += moof_size + gap + mdat_size
+    return output_path
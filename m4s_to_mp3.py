@@ -9,114 +9,148 @@ import subprocess
 from pathlib import Path
 import argparse
 
-def extract_audio(input_file, output_file):
-    """尝试直接提取音频流"""
+from fmp4 import copy_range, track_of, is_aac, is_headerless_fragment
+from m4s_to_mp4 import probe_m4s, ffmpeg_input_args
+
+def run_ffmpeg_with_stdin(cmd, header, input_file):
+    """
+    运行从 pipe:0 读取输入的 ffmpeg 命令：先写入 header，再把 input_file 的内容复制到管道，
+    不生成临时文件，也不把文件读入内存
+
+    返回:
+        bool: ffmpeg 是否成功
+    """
+    # ffmpeg 的输出不读取，直接丢弃，避免管道写满后互相等待
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        stdin_fd = process.stdin.fileno()
+        view = memoryview(header)
+        while view:
+            view = view[os.write(stdin_fd, view):]
+        with open(input_file, 'rb') as src:
+            copy_range(src.fileno(), stdin_fd, 0, os.fstat(src.fileno()).st_size)
+    except BrokenPipeError:
+        # ffmpeg 提前退出，结果以返回码为准
+        pass
+    finally:
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+    return process.wait() == 0
+
+# MP3 编码参数
+MP3_ARGS = ['-acodec', 'libmp3lame', '-q:a', '2']
+
+# 输出格式 -> (扩展名, 编码参数, 可以直接复制的音频编码)
+#   mp3  重新编码，兼容所有播放器，但速度慢且有损
+#   m4a  原样复制AAC音频流，不重新编码
+#   ogg、webm 原样复制Opus音频流，不重新编码
+#   auto 按音频编码选择：AAC 为 m4a，Opus 为 ogg，其他为 mp3
+OUTPUT_FORMATS = {
+    'mp3': ('.mp3', MP3_ARGS, None),
+    'm4a': ('.m4a', ['-acodec', 'copy'], ('mp4a',)),
+    'ogg': ('.ogg', ['-acodec', 'copy'], ('Opus',)),
+    'webm': ('.webm', ['-acodec', 'copy'], ('Opus',)),
+}
+
+def resolve_format(output_format, track):
+    """
+    确定实际的输出格式；auto 时按音频编码选择可以直接复制的格式
+
+    返回:
+        str: 输出格式，指定的复制格式与音频编码不符时返回 None
+    """
+    if output_format == 'auto':
+        if is_aac(track):
+            return 'm4a'
+        if track and track['codec'] == 'Opus':
+            return 'ogg'
+        return 'mp3'
+    codecs = OUTPUT_FORMATS[output_format][2]
+    if track and codecs and track['codec'] not in codecs:
+        return None
+    return output_format
+
+# 方法3补在文件前面的 ftyp 头部
+FTYP_HEADER = (
+    b'\x00\x00\x00\x20\x66\x74\x79\x70\x69\x73\x6f\x6d\x00\x00\x02\x00'
+    b'\x69\x73\x6f\x6d\x69\x73\x6f\x32\x61\x76\x63\x31\x6d\x70\x34\x31'
+)
+
+def choose_method(input_file):
+    """
+    读取文件头，预先判断哪种方法可以处理该文件，不再逐个尝试
+
+    返回:
+        tuple: (方法, ffmpeg 输入参数, 音频轨道信息)，方法为
+            1    ffmpeg 可以直接识别的文件（完整的MP4/m4s，或ADTS等纯音频文件）
+            2    MP4结构完整但开头有多余字节，跳过这些字节并按MP4格式读取
+            3    缺少 ftyp 头部的MP4片段，补上头部后通过管道读取
+            None 文件中没有音频轨道
+        文件头无法解析时音频轨道信息为 None
+    """
+    info = probe_m4s(input_file)
+    if info is not None:
+        track = track_of(info, 'soun')
+        if track is None:
+            return None, None, None
+        return (2 if info['offset'] else 1), ffmpeg_input_args(input_file, info), track
+    if is_headerless_fragment(input_file):
+        return 3, ['-i', 'pipe:0'], None
+    return 1, ['-i', input_file], None
+
+def extract_audio(input_file, output_file, output_format='mp3'):
+    """
+    从m4s中提取音频，按 output_format（见 OUTPUT_FORMATS）编码为MP3或原样复制音频流
+
+    先按文件头选择处理方法，再由一个 ffmpeg 进程直接从m4s读取、编码，
+    不生成中间的 .aac 或 .mp4 文件；输出文件的扩展名按实际的输出格式替换
+    """
     print(f"处理: {input_file}")
     
-    # 方法1: 直接作为音频流提取
+    method, input_args, track = choose_method(input_file)
+    if method is None:
+        print(f"× 文件中没有音频轨道: {input_file}")
+        return False
+    
+    resolved = resolve_format(output_format, track)
+    if resolved is None:
+        print(f"× 音频编码为 {track['codec']}，不能直接复制为 {output_format}，请使用 --format mp3 或 auto")
+        return False
+    extension, codec_args, _ = OUTPUT_FORMATS[resolved]
+    output_file = os.path.splitext(output_file)[0] + extension
+    
     cmd = [
         'ffmpeg',
         '-y',
-        '-i', input_file,
+        *input_args,
         '-vn',                # 不处理视频
-        '-acodec', 'copy',    # 直接复制音频流
-        output_file + '.aac'  # 先保存为aac
+        *codec_args,
+        output_file
     ]
     
-    try:
-        subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-        print(f"✓ 音频流提取成功: {output_file}.aac")
-        
-        # 将aac转换为mp3
-        cmd2 = [
-            'ffmpeg',
-            '-y',
-            '-i', output_file + '.aac',
-            '-acodec', 'libmp3lame',
-            '-q:a', '2',
-            output_file
-        ]
-        
-        subprocess.run(cmd2, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-        print(f"✓ 成功转换为MP3: {output_file}")
-        
-        # 删除临时aac文件
-        os.remove(output_file + '.aac')
-        return True
-    except subprocess.CalledProcessError:
-        print(f"× 直接提取音频流失败，尝试方法2...")
-    
-    # 方法2: 将m4s重命名为mp4后处理
-    temp_mp4 = input_file + '.mp4'
-    try:
-        # 复制文件并重命名为mp4
-        with open(input_file, 'rb') as src, open(temp_mp4, 'wb') as dst:
-            dst.write(src.read())
-        
-        # 使用mp4文件处理
-        cmd = [
-            'ffmpeg',
-            '-y',
-            '-i', temp_mp4,
-            '-vn',
-            '-acodec', 'libmp3lame',
-            '-q:a', '2',
-            output_file
-        ]
-        
-        subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-        print(f"✓ 方法2成功: {output_file}")
-        
-        # 删除临时mp4文件
-        os.remove(temp_mp4)
-        return True
-    except subprocess.CalledProcessError:
-        print(f"× 方法2也失败，尝试方法3...")
-        # 清理临时文件
-        if os.path.exists(temp_mp4):
-            os.remove(temp_mp4)
+    if method == 3:
+        # 头部和原文件依次写入 ffmpeg 的标准输入，不生成临时文件
+        ok = run_ffmpeg_with_stdin(cmd, FTYP_HEADER, input_file)
+    else:
+        ok = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE).returncode == 0
     
-    # 方法3: 追加适当的头部信息后尝试处理
-    temp_file = input_file + '.tmp'
-    try:
-        # 第一种头部信息
-        header = (
-            b'\x00\x00\x00\x20\x66\x74\x79\x70\x69\x73\x6f\x6d\x00\x00\x02\x00'
-            b'\x69\x73\x6f\x6d\x69\x73\x6f\x32\x61\x76\x63\x31\x6d\x70\x34\x31'
-        )
-        
-        with open(temp_file, 'wb') as f:
-            f.write(header)
-            with open(input_file, 'rb') as src:
-                f.write(src.read())
-        
-        cmd = [
-            'ffmpeg',
-            '-y',
-            '-i', temp_file,
-            '-vn',
-            '-acodec', 'libmp3lame',
-            '-q:a', '2',
-            output_file
-        ]
-        
-        subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-        print(f"✓ 方法3成功: {output_file}")
-        
-        # 删除临时文件
-        os.remove(temp_file)
+    if ok:
+        print(f"✓ 方法{method}成功: {output_file}")
         return True
-    except subprocess.CalledProcessError:
-        print(f"× 所有方法都失败，无法处理: {input_file}")
-        # 清理临时文件
-        if os.path.exists(temp_file):
-            os.remove(temp_file)
-        return False
+    print(f"× 方法{method}失败，无法处理: {input_file}")
+    # 删除 ffmpeg 失败时留下的不完整文件
+    if os.path.exists(output_file):
+        os.remove(output_file)
+    return False
 
 def main():
     parser = argparse.ArgumentParser(description='简单的m4s音频提取工具')
     parser.add_argument('input_dir', help='包含m4s文件的目录')
     parser.add_argument('--output_dir', '-o', help='输出目录', default='./mp3_files')
+    parser.add_argument('--format', '-f', choices=('auto', *OUTPUT_FORMATS), default='mp3',
+                        help='输出格式：mp3 重新编码；m4a、ogg、webm 原样复制音频流；auto 按音频编码自动选择')
     
     args = parser.parse_args()
     
@@ -140,7 +174,7 @@ def main():
         print(f"\n处理文件 {i}/{len(m4s_files)}: {file_path}")
         mp3_path = output_dir / f"{file_path.stem}.mp3"
         
-        if extract_audio(str(file_path), str(mp3_path)):
+        if extract_audio(str(file_path), str(mp3_path), args.format):
             success += 1
         else:
             failed += 1
@@ -1,9 +1,30 @@
 import os
 import sys
+import time
 import subprocess
 import argparse
 import shutil
 from glob import glob
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from fmp4 import probe_file, track_of, is_aac, remux_fragmented, copy_file
+
+def probe_m4s(path):
+    """读取m4s文件头部的轨道信息（见 fmp4.probe_file），无法识别时返回 None"""
+    try:
+        return probe_file(path)
+    except OSError as e:
+        print(f"读取文件头失败: {path} ({e})")
+        return None
+
+def ffmpeg_input_args(path, info=None):
+    """
+    ffmpeg 的输入参数；文件开头有多余字节（哔哩哔哩缓存）时让 ffmpeg 跳过，
+    此时 ffmpeg 无法自动识别格式，需要用 -f 指定
+    """
+    if info and info['offset']:
+        return ['-f', 'mp4', '-skip_initial_bytes', str(info['offset']), '-i', path]
+    return ['-i', path]
 
 def convert_m4s_to_mp4(input_file, output_file=None):
     """
@@ -24,7 +45,8 @@ def convert_m4s_to_mp4(input_file, output_file=None):
     
     try:
         # 使用FFmpeg进行转换
-        cmd = ['ffmpeg', '-i', input_file, '-c', 'copy', '-y', output_file]
+        info = probe_m4s(input_file)
+        cmd = ['ffmpeg', *ffmpeg_input_args(input_file, info), '-c', 'copy', '-y', output_file]
         
         result = subprocess.run(cmd, check=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         
@@ -34,10 +56,9 @@ def convert_m4s_to_mp4(input_file, output_file=None):
             return output_file
         else:
             print("转换失败，尝试使用备用方法...")
-            # 备用方法: 使用文件扩展名更改
+            # 备用方法: 使用文件扩展名更改，由内核复制（跳过文件开头的多余字节），不把整个文件读入内存
             try:
-                with open(input_file, 'rb') as src, open(output_file, 'wb') as dst:
-                    dst.write(src.read())
+                copy_file(input_file, output_file, info['offset'] if info else 0)
                 print(f"使用直接拷贝方法: {input_file} -> {output_file}")
                 if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
                     return output_file
@@ -50,7 +71,35 @@ def convert_m4s_to_mp4(input_file, output_file=None):
         print(f"转换时发生错误: {e}")
         return None
 
-def merge_video_audio_m4s(video_m4s, audio_m4s, output_file=None):
+# 不需要 ffmpeg 就能直接拼接的视频编码
+NATIVE_VIDEO_CODECS = ('avc1', 'avc3')
+
+def can_remux_natively(video_info, audio_info):
+    """两个文件都是单轨道的分片MP4，且视频为 H.264、音频为 AAC 时可以不经过 ffmpeg 直接合并"""
+    if not video_info or not audio_info:
+        return False
+    if not (video_info['fragmented'] and audio_info['fragmented']):
+        return False
+    if len(video_info['tracks']) != 1 or len(audio_info['tracks']) != 1:
+        return False
+    video_track = track_of(video_info, 'vide')
+    return bool(video_track) and video_track['codec'] in NATIVE_VIDEO_CODECS and is_aac(track_of(audio_info, 'soun'))
+
+def remux_m4s_native(video_m4s, audio_m4s, output_file):
+    """
+    不启动 ffmpeg，直接拼接两个m4s文件的片段（见 fmp4.remux_fragmented），
+    媒体数据由内核复制，失败时返回 None
+    """
+    try:
+        remux_fragmented(video_m4s, audio_m4s, output_file)
+    except (OSError, ValueError) as e:
+        print(f"直接合并失败: {e}")
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        return None
+    return output_file
+
+def merge_video_audio_m4s(video_m4s, audio_m4s, output_file=None, native=True):
     """
     合并视频m4s和音频m4s文件为一个MP4文件
     
@@ -58,6 +107,7 @@ def merge_video_audio_m4s(video_m4s, audio_m4s, output_file=None):
         video_m4s (str): 视频m4s文件路径
         audio_m4s (str): 音频m4s文件路径
         output_file (str, optional): 输出MP4文件的路径，如果不提供则自动生成
+        native (bool): H.264 + AAC 的分片MP4直接拼接片段，不启动 ffmpeg；为 False 时总是使用 ffmpeg
     
     返回:
         str: 输出文件的路径
@@ -70,43 +120,38 @@ def merge_video_audio_m4s(video_m4s, audio_m4s, output_file=None):
     
     print(f"合并: {video_m4s} + {audio_m4s} -> {output_file}")
     
+    # 先读取文件头，确定轨道类型和编码，只运行一次 ffmpeg
+    video_info = probe_m4s(video_m4s)
+    audio_info = probe_m4s(audio_m4s)
+    if (track_of(video_info, 'vide') is None and track_of(video_info, 'soun')
+            and track_of(audio_info, 'vide')):
+        print("视频和音频文件传反了，交换后合并")
+        video_m4s, audio_m4s = audio_m4s, video_m4s
+        video_info, audio_info = audio_info, video_info
+    if audio_info and track_of(audio_info, 'soun') is None:
+        print("音频文件中没有音频轨道，只使用视频文件...")
+        return convert_m4s_to_mp4(video_m4s, output_file)
+    
+    if native and can_remux_natively(video_info, audio_info):
+        if remux_m4s_native(video_m4s, audio_m4s, output_file):
+            print(f"直接合并成功: {video_m4s} + {audio_m4s} -> {output_file}")
+            return output_file
+        print("改用 ffmpeg 合并...")
+    
     # 尝试合并
     try:
-        cmd = [
-            'ffmpeg',
-            '-i', video_m4s,
-            '-i', audio_m4s,
-            '-c', 'copy',
-            '-y', output_file
-        ]
+        cmd = build_merge_command(video_m4s, audio_m4s, output_file, video_info, audio_info)
         
         result = subprocess.run(cmd, check=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         
         # 检查是否成功
-        if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
+        if result.returncode == 0 and os.path.exists(output_file) and os.path.getsize(output_file) > 0:
             print(f"合并成功: {video_m4s} + {audio_m4s} -> {output_file}")
             return output_file
         else:
-            # 如果合并失败，尝试使用备用方法
-            print("合并失败，尝试使用备用方法...")
-            alt_cmd = [
-                'ffmpeg',
-                '-i', video_m4s,
-                '-i', audio_m4s,
-                '-bsf:a', 'aac_adtstoasc',
-                '-c', 'copy',
-                '-y', output_file
-            ]
-            
-            alt_result = subprocess.run(alt_cmd, check=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            
-            if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
-                print(f"备用方法合并成功: {video_m4s} + {audio_m4s} -> {output_file}")
-                return output_file
-            else:
-                # 如果仍然失败，只使用视频文件
-                print("备用方法合并失败，只使用视频文件...")
-                return convert_m4s_to_mp4(video_m4s, output_file)
+            # 命令是按文件头选择的，失败说明音频无法使用，只使用视频文件
+            print("合并失败，只使用视频文件...")
+            return convert_m4s_to_mp4(video_m4s, output_file)
     
     except Exception as e:
         print(f"合并时发生错误: {e}")
@@ -114,20 +159,101 @@ def merge_video_audio_m4s(video_m4s, audio_m4s, output_file=None):
         print("发生错误，只使用视频文件...")
         return convert_m4s_to_mp4(video_m4s, output_file)
 
-def process_bilibili_structure(root_dir):
+def run_conversion_jobs(jobs, workers=None):
     """
-    处理哔哩哔哩下载的目录结构
+    同时运行多个转换任务，结束后打印成功/失败汇总表
+
+    参数:
+        jobs (list): (名称, 函数, 参数元组) 列表，函数返回输出文件路径，失败时返回 None
+        workers (int, optional): 同时运行的任务数，默认为CPU核数
+
+    -c copy 的转换主要耗时在读写文件上，每个任务只是等待 ffmpeg 子进程结束，
+    因此用线程池调度，多个 ffmpeg 进程可以同时进行
+
+    返回:
+        list: 按任务顺序排列的 (名称, 输出文件路径或 None, 耗时秒数)
+    """
+    if not jobs:
+        return []
+    workers = workers or os.cpu_count()
+
+    def timed(fn, args):
+        start = time.perf_counter()
+        try:
+            output_file = fn(*args)
+        except Exception as e:
+            print(f"任务出错: {e}")
+            output_file = None
+        if output_file and not (os.path.exists(output_file) and os.path.getsize(output_file) > 0):
+            output_file = None
+        return output_file, time.perf_counter() - start
+
+    results = [None] * len(jobs)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(timed, fn, args): i for i, (_, fn, args) in enumerate(jobs)}
+        for future in as_completed(futures):
+            i = futures[future]
+            output_file, seconds = future.result()
+            results[i] = (jobs[i][0], output_file, seconds)
+
+    print_results_table(results)
+    return results
+
+def print_results_table(results):
+    """打印每个任务的结果、输出大小和耗时，以及成功、失败的总数"""
+    print(f"\n{'结果':<4} {'大小(MB)':>10} {'耗时(s)':>8}  任务")
+    for name, output_file, seconds in results:
+        if output_file:
+            print(f"{'成功':<4} {os.path.getsize(output_file) / 1024 / 1024:>10.2f} {seconds:>8.1f}  {name}")
+        else:
+            print(f"{'失败':<4} {'-':>10} {seconds:>8.1f}  {name}")
+    success = sum(1 for _, output_file, _ in results if output_file)
+    print(f"\n处理完成! 成功: {success}, 失败: {len(results) - success}")
+
+def convert_bilibili_video(video_files, audio_files, m4s_files, output_file, native=True):
+    """处理一个哔哩哔哩视频目录中识别出的文件，返回输出文件路径；native 见 merge_video_audio_m4s"""
+    result = None
+    if video_files and audio_files:
+        print(f"  尝试合并视频和音频...")
+        result = merge_video_audio_m4s(video_files[0], audio_files[0], output_file, native)
+        if not result:
+            print("  合并失败，尝试只处理视频文件...")
+            result = convert_m4s_to_mp4(video_files[0], output_file)
+    elif video_files:
+        print("  只找到视频文件，直接转换...")
+        result = convert_m4s_to_mp4(video_files[0], output_file)
+    elif m4s_files:
+        print("  使用找到的第一个m4s文件...")
+        result = convert_m4s_to_mp4(m4s_files[0], output_file)
+    else:
+        print("  没有可处理的文件")
+    
+    # 检查最终输出
+    if os.path.exists(output_file):
+        print(f"  成功生成: {output_file} ({os.path.getsize(output_file) / 1024 / 1024:.2f} MB)")
+    else:
+        print(f"  无法生成输出文件")
+    return result
+
+def plan_bilibili_jobs(root_dir, native=True):
+    """
+    扫描哔哩哔哩下载的目录结构，为每个视频目录生成一个转换任务
     
     参数:
         root_dir (str): 包含多个视频目录的根目录
+        native (bool): 合并时是否直接拼接分片，见 merge_video_audio_m4s
+    
+    返回:
+        list: run_conversion_jobs 使用的任务列表
     """
     # 遍历根目录下的所有子目录（视频ID目录）
     video_dirs = [d for d in os.listdir(root_dir) if os.path.isdir(os.path.join(root_dir, d)) and d.isdigit()]
     
     if not video_dirs:
         print(f"在 {root_dir} 中没有找到视频目录")
-        return
+        return []
     
+    jobs = []
     for video_dir in video_dirs:
         video_path = os.path.join(root_dir, video_dir)
         print(f"\n处理视频目录: {video_dir}")
@@ -163,22 +289,35 @@ def process_bilibili_structure(root_dir):
         for f in m4s_files:
             print(f"    - {os.path.basename(f)} ({os.path.getsize(f) / 1024 / 1024:.2f} MB)")
         
-        # 识别视频和音频文件
-        # 哔哩哔哩通常使用特定的后缀
-        video_files = [f for f in m4s_files if '30032' in f]
-        audio_files = [f for f in m4s_files if '30232' in f]
-        
-        # 如果没找到符合特定模式的文件，按大小排序
-        if not video_files or not audio_files:
-            print("  未找到符合标准模式的文件，按大小排序...")
-            m4s_files.sort(key=lambda x: os.path.getsize(x), reverse=True)
+        # 识别视频和音频文件：先读取文件头中的轨道类型
+        video_files, audio_files, unknown_files = classify_m4s_files(m4s_files)
+        if video_files and audio_files:
+            print(f"  按文件头识别: 视频 {os.path.basename(video_files[0])}，音频 {os.path.basename(audio_files[0])}")
+        elif video_files or audio_files:
+            # 只识别出一种轨道时保留识别结果，另一种只从无法识别的文件中选择
+            if video_files:
+                audio_files = pick_unknown_m4s(unknown_files, '30232')
+            else:
+                video_files = pick_unknown_m4s(unknown_files, '30032')
+            print(f"  按文件头识别: 视频 {len(video_files)} 个，音频 {len(audio_files)} 个"
+                  f"（{len(unknown_files)} 个文件无法识别）")
+        else:
+            # 文件头都无法识别时，哔哩哔哩通常使用特定的后缀
+            print("  文件头无法识别，按文件名判断...")
+            video_files = [f for f in m4s_files if '30032' in f]
+            audio_files = [f for f in m4s_files if '30232' in f]
             
-            if len(m4s_files) >= 2:
-                video_files = [m4s_files[0]]  # 最大的文件可能是视频
-                audio_files = [m4s_files[1]]  # 第二大的可能是音频
-            elif len(m4s_files) == 1:
-                video_files = [m4s_files[0]]
-                audio_files = []
+            # 如果没找到符合特定模式的文件，按大小排序
+            if not video_files or not audio_files:
+                print("  未找到符合标准模式的文件，按大小排序...")
+                m4s_files.sort(key=lambda x: os.path.getsize(x), reverse=True)
+                
+                if len(m4s_files) >= 2:
+                    video_files = [m4s_files[0]]  # 最大的文件可能是视频
+                    audio_files = [m4s_files[1]]  # 第二大的可能是音频
+                elif len(m4s_files) == 1:
+                    video_files = [m4s_files[0]]
+                    audio_files = []
         
         # 输出文件路径 - 放在上级目录
         output_dir = os.path.dirname(root_dir)
@@ -186,30 +325,61 @@ def process_bilibili_structure(root_dir):
         output_file = os.path.join(output_dir, f"{safe_title}_{video_dir}.mp4")
         
         print(f"  输出文件: {output_file}")
-        
-        # 处理文件
-        if video_files and audio_files:
-            print(f"  尝试合并视频和音频...")
-            result = merge_video_audio_m4s(video_files[0], audio_files[0], output_file)
-            if not result:
-                print("  合并失败，尝试只处理视频文件...")
-                convert_m4s_to_mp4(video_files[0], output_file)
-        elif video_files:
-            print("  只找到视频文件，直接转换...")
-            convert_m4s_to_mp4(video_files[0], output_file)
-        elif m4s_files:
-            print("  使用找到的第一个m4s文件...")
-            convert_m4s_to_mp4(m4s_files[0], output_file)
-        else:
-            print("  没有可处理的文件")
-        
-        # 检查最终输出
-        if os.path.exists(output_file):
-            print(f"  成功生成: {output_file} ({os.path.getsize(output_file) / 1024 / 1024:.2f} MB)")
+        jobs.append((f"{video_dir} {video_title}", convert_bilibili_video,
+                     (video_files, audio_files, m4s_files, output_file, native)))
+    return jobs
+
+def build_merge_command(video_m4s, audio_m4s, output_file, video_info=None, audio_info=None):
+    """
+    按文件头的探测结果生成合并命令：
+
+    - 文件开头有多余字节时用 -skip_initial_bytes 跳过
+    - 音频不是 MP4 容器（裸的ADTS格式AAC）时才需要 aac_adtstoasc 转换
+    """
+    cmd = ['ffmpeg', *ffmpeg_input_args(video_m4s, video_info), *ffmpeg_input_args(audio_m4s, audio_info)]
+    if audio_info is None:
+        cmd += ['-bsf:a', 'aac_adtstoasc']
+    return cmd + ['-c', 'copy', '-y', output_file]
+
+def pick_unknown_m4s(unknown_files, suffix):
+    """从文件头无法识别的文件中挑选另一种轨道：优先按文件名中的哔哩哔哩后缀，否则取最大的文件"""
+    matched = [f for f in unknown_files if suffix in f]
+    if matched:
+        return matched
+    return sorted(unknown_files, key=os.path.getsize, reverse=True)[:1]
+
+def classify_m4s_files(m4s_files):
+    """
+    按文件头中的轨道类型区分视频和音频文件，各自按文件大小从大到小排序（画质、音质最高的在前）
+
+    返回:
+        tuple: (视频文件列表, 音频文件列表, 无法识别的文件列表)
+    """
+    video_files, audio_files, unknown_files = [], [], []
+    for path in m4s_files:
+        info = probe_m4s(path)
+        if track_of(info, 'vide'):
+            video_files.append(path)
+        elif track_of(info, 'soun'):
+            audio_files.append(path)
         else:
-            print(f"  无法生成输出文件")
+            unknown_files.append(path)
+    video_files.sort(key=os.path.getsize, reverse=True)
+    audio_files.sort(key=os.path.getsize, reverse=True)
+    return video_files, audio_files, unknown_files
 
-def batch_process_directory(directory, pattern='*.m4s', is_paired=False):
+def process_bilibili_structure(root_dir, workers=None, native=True):
+    """
+    处理哔哩哔哩下载的目录结构
+    
+    参数:
+        root_dir (str): 包含多个视频目录的根目录
+        workers (int, optional): 同时运行的 ffmpeg 任务数，默认为CPU核数
+        native (bool): 合并时是否直接拼接分片，为 False 时总是使用 ffmpeg
+    """
+    return run_conversion_jobs(plan_bilibili_jobs(root_dir, native), workers)
+
+def batch_process_directory(directory, pattern='*.m4s', is_paired=False, workers=None, native=True):
     """
     批量处理目录中的所有m4s文件
     
@@ -217,6 +387,8 @@ def batch_process_directory(directory, pattern='*.m4s', is_paired=False):
         directory (str): 包含m4s文件的目录
         pattern (str): 文件匹配模式
         is_paired (bool): 是否将文件视为音视频配对处理
+        workers (int, optional): 同时运行的 ffmpeg 任务数，默认为CPU核数
+        native (bool): 合并时是否直接拼接分片，为 False 时总是使用 ffmpeg
     """
     # 检测是否为哔哩哔哩下载的目录结构
     is_bilibili = False
@@ -227,8 +399,7 @@ def batch_process_directory(directory, pattern='*.m4s', is_paired=False):
     
     if is_bilibili:
         print("检测到哔哩哔哩下载目录结构，使用专用处理方法...")
-        process_bilibili_structure(directory)
-        return
+        return process_bilibili_structure(directory, workers, native)
     
     # 常规处理方法
     files = glob(os.path.join(directory, pattern))
@@ -253,14 +424,18 @@ def batch_process_directory(directory, pattern='*.m4s', is_paired=False):
             audio_files = files[mid:]
         
         # 配对处理
+        jobs = []
         for i in range(min(len(video_files), len(audio_files))):
             output_file = os.path.splitext(video_files[i])[0] + '.mp4'
-            merge_video_audio_m4s(video_files[i], audio_files[i], output_file)
+            jobs.append((os.path.basename(output_file), merge_video_audio_m4s,
+                         (video_files[i], audio_files[i], output_file, native)))
     else:
         # 单独处理每个文件
+        jobs = []
         for file in files:
             output_file = os.path.splitext(file)[0] + '.mp4'
-            convert_m4s_to_mp4(file, output_file)
+            jobs.append((os.path.basename(output_file), convert_m4s_to_mp4, (file, output_file)))
+    return run_conversion_jobs(jobs, workers)
 
 def main():
     parser = argparse.ArgumentParser(description='将m4s文件转换或合并为MP4格式')
@@ -273,6 +448,8 @@ def main():
     parser.add_argument('-a', '--audio', required=False, help='音频m4s文件路径')
     parser.add_argument('-p', '--paired', action='store_true', help='将目录中的文件作为音视频对处理')
     parser.add_argument('-b', '--bilibili', action='store_true', help='处理哔哩哔哩下载目录结构')
+    parser.add_argument('--ffmpeg', action='store_true', help='合并时总是使用 ffmpeg，不直接拼接分片')
+    parser.add_argument('-j', '--jobs', type=int, help='批量处理时同时运行的 ffmpeg 任务数，默认为CPU核数')
     
     args = parser.parse_args()
     
@@ -288,13 +465,14 @@ def main():
     if args.directory:
         if args.bilibili:
             # 直接使用哔哩哔哩专用处理方法
-            process_bilibili_structure(args.directory)
+            process_bilibili_structure(args.directory, args.jobs, native=not args.ffmpeg)
         else:
             # 批量处理目录
-            batch_process_directory(args.directory, is_paired=args.paired)
+            batch_process_directory(args.directory, is_paired=args.paired, workers=args.jobs,
+                                    native=not args.ffmpeg)
     elif args.video and args.audio:
         # 合并视频和音频
-        merge_video_audio_m4s(args.video, args.audio, args.output)
+        merge_video_audio_m4s(args.video, args.audio, args.output, native=not args.ffmpeg)
     elif args.input:
         # 单文件处理
         convert_m4s_to_mp4(args.input, args.output)
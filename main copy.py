@@ -125,6 +125,7 @@ from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 from lxml import etree
 import re
+from reflow import remove_docx_line_breaks
 
 def is_line_break(element):
     """检查一个XML元素是否为软回车（<w:br/>）"""
@@ -142,11 +143,18 @@ def remove_unnecessary_line_breaks(doc):
                     run._r.remove(elem)  # 移除折行符
     return doc
 
-# 读取输入文档
-input_doc = Document("./我的科研助理：GPT.docx")
+# 流式模式：直接改写 word/document.xml，不构建 python-docx 对象模型，
+# 只删除前文没有标点结尾的软回车，其他部件原样复制
+STREAMING = True
 
-# 处理文档
-processed_doc = remove_unnecessary_line_breaks(input_doc)
+if STREAMING:
+    remove_docx_line_breaks("./我的科研助理：GPT.docx", "./output.docx")
+else:
+    # 读取输入文档
+    input_doc = Document("./我的科研助理：GPT.docx")
 
-# 保存输出
-processed_doc.save("./output.docx")
\ No newline at end of file
+    # 处理文档
+    processed_doc = remove_unnecessary_line_breaks(input_doc)
+
+    # 保存输出
+    processed_doc.save("./output.docx")
\ No newline at end of file
@@ -1,40 +1,36 @@
-import re
+import os
+import json
+import hashlib
+import argparse
+import fnmatch
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from reflow import FORMATS, PUNCTUATION, reflow_lines, read_txt_lines, write_txt_lines, read_pdf_lines, reflow_file
 
 def remove_unnecessary_line_breaks(text):
     """
     删除不必要的折行符（如果行尾没有标点符号）
     """
-    # 将文本按行分割
-    lines = text.splitlines()
-    
-    # 初始化一个列表来存储处理后的行
-    processed_lines = []
-    
-    # 遍历每一行
-    i = 0
-    while i < len(lines):
-        # 如果当前行不为空
-        if lines[i].strip():
-            # 检查当前行末尾是否有标点符号
-            if not re.search(r'[。！？，、；：,.!?;:]$', lines[i].rstrip()):
-                # 如果行尾没有标点符号，则与下一行合并
-                if i < len(lines) - 1:
-                    lines[i + 1] = lines[i].rstrip() + ' ' + lines[i + 1].lstrip()
-                else:
-                    processed_lines.append(lines[i].rstrip())
-            else:
-                # 如果行尾有标点符号，则直接保留
-                processed_lines.append(lines[i].rstrip())
-        i += 1
-    
-    # 将处理后的行重新组合成文本
-    processed_text = '\n'.join(processed_lines)
-    return processed_text
+    # 将文本按行分割，合并后的段落重新组合成文本
+    return '\n'.join(reflow_lines(text.splitlines()))
 
-def process_txt_file(input_file, output_file):
+def stream_txt_file(input_file, output_file, buffer_size=1024 * 1024):
+    """
+    流式处理TXT文件：逐行读取、逐段写出，内存占用与文件大小无关
+    """
+    write_txt_lines(reflow_lines(read_txt_lines(input_file, buffer_size)), output_file, buffer_size)
+
+def process_txt_file(input_file, output_file, streaming=False):
     """
     处理TXT文件：读取输入文件，删除不必要的折行符，保存到输出文件
+
+    streaming=True 时逐行流式处理，适合几百MB的OCR文本
     """
+    if streaming:
+        stream_txt_file(input_file, output_file)
+        print(f"处理后的文件已保存到: {output_file}")
+        return
+
     # 读取输入文件内容
     with open(input_file, 'r', encoding='utf-8') as file:
         text = file.read()
@@ -48,7 +44,199 @@ def process_txt_file(input_file, output_file):
     
     print(f"处理后的文件已保存到: {output_file}")
 
-# 示例调用
-input_file = 'input.txt'  # 输入文件路径
-output_file = 'output.txt'  # 输出文件路径
-process_txt_file(input_file, output_file)
\ No newline at end of file
+def process_pdf_file(input_file, output_file, workers=None):
+    """
+    直接从PDF提取文字并删除不必要的折行符，逐段写出到TXT文件
+
+    各页的文字由 workers 个进程并行提取（None 表示使用全部CPU核），按页码顺序送入
+    折行合并，跨页断开的段落也会合并；整本书的文字不会同时保存在内存中
+    """
+    write_txt_lines(reflow_lines(read_pdf_lines(input_file, workers)), output_file)
+    print(f"处理后的文件已保存到: {output_file}")
+
+# 批处理时记录已处理文件的清单文件名（保存在输出目录中）
+MANIFEST_NAME = '.reflow_manifest.json'
+
+def reflow_settings():
+    """影响输出结果的处理参数，参数变化时清单失效，所有文件都会重新处理"""
+    return {
+        'version': 3,
+        'punctuation': ''.join(sorted(PUNCTUATION)),
+    }
+
+def _file_digest(path, chunk_size=1024 * 1024):
+    """分块计算文件的SHA-256，不把整个文件读入内存"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _reflow_job(input_file, output_file, known_digest):
+    """
+    进程池中的单个任务：内容哈希与清单一致时跳过处理
+
+    返回:
+        tuple: (输入文件的哈希, 是否重新生成了输出文件)
+    """
+    digest = _file_digest(input_file)
+    if digest == known_digest and os.path.exists(output_file):
+        return digest, False
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    if input_file.lower().endswith('.pdf'):
+        # 批处理已经按文件并行，单个PDF在当前进程中提取，不再启动进程池
+        process_pdf_file(input_file, output_file, workers=1)
+    else:
+        reflow_file(input_file, output_file)
+    return digest, True
+
+# 批处理时不能原样写出的格式，输出改用对应的扩展名
+BATCH_OUTPUT_EXTENSIONS = {'.pdf': '.txt'}
+
+def batch_output_path(output_dir, rel_path):
+    """输入文件在输出目录中对应的路径，PDF 输出为同名的 TXT"""
+    root, extension = os.path.splitext(rel_path)
+    extension = BATCH_OUTPUT_EXTENSIONS.get(extension.lower(), extension)
+    return os.path.join(output_dir, root + extension)
+
+# 批处理默认处理的文件类型，TXT、Markdown 使用同一个折行合并核心，
+# DOCX 只删除段落内的软回车，保留原文档的格式
+DEFAULT_PATTERNS = ('*.txt', '*.md', '*.docx')
+
+def find_files(directory, patterns=DEFAULT_PATTERNS, exclude_dir=None):
+    """递归查找目录树中匹配任一模式的文件，跳过输出目录本身"""
+    exclude_dir = os.path.abspath(exclude_dir) if exclude_dir else None
+    matches = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if os.path.abspath(os.path.join(root, d)) != exclude_dir)
+        for file in sorted(files):
+            if any(fnmatch.fnmatch(file, pattern) for pattern in patterns):
+                matches.append(os.path.join(root, file))
+    return matches
+
+def _load_manifest(manifest_path, settings):
+    """读取清单；清单损坏或处理参数变化时返回空清单"""
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('settings') != settings:
+        return {}
+    return manifest.get('files', {})
+
+def _save_manifest(manifest_path, settings, entries):
+    """先写临时文件再替换，避免中断时留下半个清单"""
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump({'settings': settings, 'files': entries}, file, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(temp_path, manifest_path)
+
+def batch_process_directory(directory, output_dir=None, patterns=DEFAULT_PATTERNS, workers=None):
+    """
+    批量处理目录树中的TXT、Markdown、DOCX文件，输出到 output_dir 中相同的相对路径；
+    用 --pattern '*.pdf' 指定的PDF文件输出为相同相对路径下的TXT
+
+    参数:
+        directory (str): 输入目录
+        output_dir (str, optional): 输出目录，默认为输入目录旁的 "<目录名>_reflowed"
+        patterns (tuple): 文件匹配模式
+        workers (int, optional): 进程数，默认为CPU核数
+
+    大小和修改时间与清单一致的文件只需一次 stat 即可跳过；
+    修改时间变了但内容哈希未变的文件只更新清单，不重新处理
+    """
+    if output_dir is None:
+        output_dir = os.path.normpath(directory) + '_reflowed'
+    os.makedirs(output_dir, exist_ok=True)
+
+    settings = reflow_settings()
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    old_entries = _load_manifest(manifest_path, settings)
+    entries = {}
+
+    files = find_files(directory, patterns, exclude_dir=output_dir)
+    if not files:
+        print(f"在 {directory} 中没有找到匹配的文件")
+        return
+
+    print(f"找到 {len(files)} 个文件")
+
+    # 先用 stat 筛掉未变化的文件
+    jobs = {}
+    skipped = 0
+    for input_file in files:
+        rel_path = os.path.relpath(input_file, directory)
+        output_file = batch_output_path(output_dir, rel_path)
+        stat = os.stat(input_file)
+        entry = old_entries.get(rel_path)
+        if (entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns
+                and os.path.exists(output_file)):
+            entries[rel_path] = entry
+            skipped += 1
+            continue
+        known_digest = entry['sha256'] if entry else None
+        jobs[rel_path] = (input_file, output_file, known_digest, stat)
+
+    processed = 0
+    unchanged = 0
+    failed = 0
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            futures = {
+                executor.submit(_reflow_job, input_file, output_file, known_digest): rel_path
+                for rel_path, (input_file, output_file, known_digest, _) in jobs.items()
+            }
+            for future in as_completed(futures):
+                rel_path = futures[future]
+                stat = jobs[rel_path][3]
+                try:
+                    digest, rewritten = future.result()
+                except Exception as e:
+                    print(f"处理失败: {rel_path} ({e})")
+                    failed += 1
+                    continue
+                entries[rel_path] = {
+                    'size': stat.st_size,
+                    'mtime_ns': stat.st_mtime_ns,
+                    'sha256': digest,
+                }
+                if rewritten:
+                    print(f"已处理: {rel_path}")
+                    processed += 1
+                else:
+                    unchanged += 1
+
+    _save_manifest(manifest_path, settings, entries)
+    print(f"\n处理完成! 处理: {processed}, 未变化跳过: {skipped + unchanged}, 失败: {failed}")
+    print(f"输出目录: {output_dir}")
+
+def main():
+    parser = argparse.ArgumentParser(description='删除TXT、Markdown、DOCX文件中不必要的折行符，也可以直接处理PDF')
+    parser.add_argument('-i', '--input', default='input.txt', help='输入文件路径，按扩展名选择处理方式')
+    parser.add_argument('-o', '--output', default='output.txt', help='输出文件路径')
+    parser.add_argument('-d', '--directory', help='批量处理的目录（递归查找）')
+    parser.add_argument('--output-dir', help='批量处理的输出目录，默认为 "<目录名>_reflowed"')
+    parser.add_argument('--pattern', action='append', help='批量处理时的文件匹配模式，可重复指定，默认为 *.txt *.md *.docx')
+    parser.add_argument('-j', '--jobs', type=int, help='批量处理或PDF提取文字的进程数，默认为CPU核数')
+    parser.add_argument('-s', '--streaming', action='store_true', help='单文件逐行流式处理')
+
+    args = parser.parse_args()
+
+    if args.directory:
+        patterns = tuple(args.pattern) if args.pattern else DEFAULT_PATTERNS
+        batch_process_directory(args.directory, args.output_dir, patterns, args.jobs)
+    elif args.input.lower().endswith('.pdf'):
+        process_pdf_file(args.input, args.output, args.jobs)
+    elif os.path.splitext(args.input)[1].lower() in FORMATS.keys() - {'.txt'}:
+        # Markdown、DOCX 等按扩展名选择对应的读取、合并和写出方式
+        try:
+            reflow_file(args.input, args.output)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"处理后的文件已保存到: {args.output}")
+    else:
+        process_txt_file(args.input, args.output, streaming=args.streaming)
+
+if __name__ == "__main__":
+    main()
@@ -5,94 +5,1081 @@ LastEditors: Diana Tang
 Description: some description
 FilePath: /AI-Health-News-Agent-Back/main.py
 '''
+import io
 import os
-import tempfile
+import re
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ProcessPoolExecutor
 import fitz  # PyMuPDF
 import cv2
 import numpy as np
-from PIL import Image, ImageEnhance
-from pdf2image import convert_from_path
+from PIL import Image
 
-def enhance_pdf_clarity(input_pdf_path, output_pdf_path, dpi=300):
-    """提升PDF文件的清晰度"""
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，不记录内存
+    resource = None
+
+# 性能分析记录的阶段
+PROFILE_STAGES = ('render', 'denoise', 'sharpen', 'enhance', 'encode', 'insert')
+
+def peak_rss_mb():
+    """当前进程到目前为止的峰值常驻内存（MB），无法获取时返回 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 以字节为单位，Linux 以KB为单位
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+def current_rss_mb():
+    """当前进程此刻的常驻内存（MB），从 /proc/self/statm 读取，无法获取时返回 None"""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+
+def reset_peak_rss():
+    """把本进程的内存峰值（VmHWM）重置为当前的常驻内存，只支持 Linux，成功时返回 True"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return True
+
+def stage_peak_rss_mb():
+    """上次 reset_peak_rss 之后本进程的峰值常驻内存（MB），从 /proc/self/status 读取"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+class StageProfiler:
+    """
+    按页记录各阶段的耗时和内存：
+    pages[页码][阶段] = {'seconds': 耗时, 'rss_before_mb': 阶段开始时的内存, 'peak_rss_mb': 阶段内的峰值内存}
+
+    每个阶段开始前重置进程的内存峰值，结束时读取，阶段内临时分配又释放的内存（如NLM的工作缓冲区）
+    也会计入；多进程时为执行该阶段的工作进程的内存。不支持重置峰值的系统上 peak_rss_mb 为 None。
+    分块处理时同一页的同一阶段会执行多次，耗时累加，内存取各次的最大值
+    """
+
+    def __init__(self):
+        self.pages = {}
+        self.current = None
+
+    @contextmanager
+    def stage(self, name):
+        rss_before = current_rss_mb()
+        measured = reset_peak_rss()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(self.current, name, time.perf_counter() - start, rss_before,
+                     stage_peak_rss_mb() if measured else None)
+
+    def add(self, page_index, name, seconds, rss_before_mb, peak_mb):
+        record = self.pages.setdefault(page_index, {}).setdefault(
+            name, {'seconds': 0.0, 'rss_before_mb': None, 'peak_rss_mb': None})
+        record['seconds'] += seconds
+        for key, value in (('rss_before_mb', rss_before_mb), ('peak_rss_mb', peak_mb)):
+            if value is not None:
+                record[key] = max(record[key] or 0.0, value)
+
+    def merge(self, page_index, stages):
+        """合并工作进程返回的单页记录"""
+        for name, record in (stages or {}).items():
+            self.add(page_index, name, record['seconds'], record['rss_before_mb'], record['peak_rss_mb'])
+
+    def max_peak_rss_mb(self):
+        """所有阶段中最大的峰值内存，没有记录时返回 None"""
+        peaks = [record['peak_rss_mb'] for stages in self.pages.values() for record in stages.values()
+                 if record['peak_rss_mb'] is not None]
+        return max(peaks) if peaks else None
+
+    def pop(self, page_index):
+        return self.pages.pop(page_index, {})
+
+    def report(self, **summary):
+        """汇总为可写入JSON的报告，summary 中的字段原样写入"""
+        totals = {name: 0.0 for name in PROFILE_STAGES}
+        pages = []
+        for page_index in sorted(self.pages, key=lambda i: (i is None, i)):
+            stages = self.pages[page_index]
+            for name, record in stages.items():
+                totals[name] = totals.get(name, 0.0) + record['seconds']
+            pages.append({
+                'page': None if page_index is None else page_index + 1,
+                'seconds': sum(record['seconds'] for record in stages.values()),
+                'stages': stages,
+            })
+        return dict(summary, stage_seconds=totals, pages=pages)
+
+# 当前进程的性能记录，为 None 时不记录
+_profiler = None
+
+def profile_stage(name):
+    """记录一个阶段的耗时和内存，没有开启性能分析时什么也不做"""
+    return _profiler.stage(name) if _profiler is not None else nullcontext()
+
+def render_page(page, dpi=300):
+    """用 fitz 把单页渲染为 OpenCV 的 BGR 图像，一次只占用一页的内存"""
+    with profile_stage('render'):
+        pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csRGB, alpha=False)
+        img_np = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+        return cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
+
+# 第2步锐化使用的卷积核
+SHARPEN_KERNEL = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]], dtype=np.float32)
+
+# PIL ImageFilter.SMOOTH 的卷积核，ImageEnhance.Sharpness 以它为退化图像
+_SMOOTH_KERNEL = np.array([[1,1,1], [1,5,1], [1,1,1]], dtype=np.float32) / 13
+
+def contrast_brightness_lut(mean, contrast=1.2, brightness=1.1):
+    """
+    预先计算对比度和亮度调整的查找表，与 ImageEnhance.Contrast、ImageEnhance.Brightness
+    依次调用的结果一致（每一步之后都截断到 0-255）
+    """
+    values = np.arange(256, dtype=np.float32)
+    values = np.clip(np.rint(mean + contrast * (values - mean)), 0, 255)
+    values = np.clip(np.rint(values * brightness), 0, 255)
+    return values.astype(np.uint8)
+
+def sharpness_kernel(sharpness=1.5):
+    """ImageEnhance.Sharpness 等价的卷积核：smooth + factor * (img - smooth)"""
+    identity = np.zeros((3, 3), dtype=np.float32)
+    identity[1, 1] = 1
+    return sharpness * identity + (1 - sharpness) * _SMOOTH_KERNEL
+
+# 去噪档位：
+#   color 彩色NLM（原有方式，最慢）
+#   gray  灰度NLM，适合黑白文字页，输出灰度图像
+#   luma  只对缩小一半的亮度通道做NLM，色度通道用中值滤波
+#   fast  3x3 中值滤波
+#   off   不去噪
+#   auto  按页面的色彩和噪声统计自动选择
+DENOISE_TIERS = ('auto', 'color', 'gray', 'luma', 'fast', 'off')
+
+# 自动选择档位的阈值
+_MONOCHROME_THRESHOLD = 6.0   # 通道间平均差值低于该值视为黑白页
+_LOW_NOISE_THRESHOLD = 1.5    # 噪声标准差低于该值不去噪
+_HIGH_NOISE_THRESHOLD = 5.0   # 噪声标准差高于该值使用NLM
+
+# Immerkær 噪声估计的卷积核
+_NOISE_KERNEL = np.array([[1,-2,1], [-2,4,-2], [1,-2,1]], dtype=np.float32)
+
+def page_statistics(img_cv, sample_size=512):
+    """
+    用页面中心的一块区域快速估计色彩程度和噪声标准差
+
+    返回:
+        tuple: (通道间平均差值, 噪声标准差)
+    """
+    height, width = img_cv.shape[:2]
+    top = max(0, (height - sample_size) // 2)
+    left = max(0, (width - sample_size) // 2)
+    sample = img_cv[top:top + sample_size, left:left + sample_size]
+
+    if sample.ndim == 3:
+        channels = sample.astype(np.int16)
+        colorfulness = float(np.mean(np.abs(channels[..., 0] - channels[..., 1]))
+                             + np.mean(np.abs(channels[..., 1] - channels[..., 2])))
+        gray = cv2.cvtColor(sample, cv2.COLOR_BGR2GRAY)
+    else:
+        colorfulness = 0.0
+        gray = sample
+
+    response = cv2.filter2D(gray.astype(np.float32), -1, _NOISE_KERNEL)[1:-1, 1:-1]
+    sigma = float(np.sqrt(np.pi / 2) * np.mean(np.abs(response)) / 6)
+    return colorfulness, sigma
+
+def choose_denoise_tier(img_cv):
+    """根据页面统计选择去噪档位：黑白页不按彩色处理，噪声很低的页面不去噪"""
+    colorfulness, sigma = page_statistics(img_cv)
+    if sigma < _LOW_NOISE_THRESHOLD:
+        return 'off'
+    if colorfulness < _MONOCHROME_THRESHOLD:
+        return 'gray' if sigma >= _HIGH_NOISE_THRESHOLD else 'fast'
+    return 'color' if sigma >= _HIGH_NOISE_THRESHOLD else 'luma'
+
+def denoise_image(img_cv, tier='auto'):
+    """
+    按档位去噪
+
+    返回:
+        tuple: (去噪后的图像, 实际使用的档位)；gray 档位返回单通道灰度图像
+    """
+    if tier == 'auto':
+        tier = choose_denoise_tier(img_cv)
+
+    if tier == 'color':
+        img_cv = cv2.fastNlMeansDenoisingColored(img_cv, None, 10, 10, 7, 21)
+    elif tier == 'gray':
+        if img_cv.ndim == 3:
+            img_cv = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
+        img_cv = cv2.fastNlMeansDenoising(img_cv, None, 10, 7, 21)
+    elif tier == 'luma':
+        ycrcb = cv2.cvtColor(img_cv, cv2.COLOR_BGR2YCrCb)
+        luma = ycrcb[..., 0]
+        height, width = luma.shape
+        small = cv2.resize(luma, (width // 2, height // 2), interpolation=cv2.INTER_AREA)
+        small = cv2.fastNlMeansDenoising(small, None, 10, 7, 21)
+        ycrcb[..., 0] = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+        ycrcb[..., 1] = cv2.medianBlur(np.ascontiguousarray(ycrcb[..., 1]), 3)
+        ycrcb[..., 2] = cv2.medianBlur(np.ascontiguousarray(ycrcb[..., 2]), 3)
+        img_cv = cv2.cvtColor(ycrcb, cv2.COLOR_YCrCb2BGR)
+    elif tier == 'fast':
+        img_cv = cv2.medianBlur(img_cv, 3)
+    elif tier != 'off':
+        raise ValueError(f"不支持的去噪档位: {tier}，可选: {', '.join(DENOISE_TIERS)}")
+    return img_cv, tier
+
+def denoise_and_sharpen(img_cv, denoise='auto'):
+    """局部处理阶段：去噪和锐化，只依赖像素邻域，可以分块进行"""
+    # 1. 去噪
+    with profile_stage('denoise'):
+        img_cv, _ = denoise_image(img_cv, denoise)
+    
+    # 2. 锐化
+    with profile_stage('sharpen'):
+        cv2.filter2D(img_cv, -1, SHARPEN_KERNEL, dst=img_cv)
+    return img_cv
+
+def finish_image(img_cv, contrast=1.2, brightness=1.1, sharpness=1.5):
+    """整页处理阶段：对比度、亮度和锐度增强，就地修改后返回PIL图像"""
+    # 3. 对比度增强 + 4. 亮度调整：以灰度均值为中心的查找表
+    if img_cv.ndim == 3:
+        blue, green, red = cv2.mean(img_cv)[:3]
+        mean = int(0.299 * red + 0.587 * green + 0.114 * blue + 0.5)
+    else:
+        mean = int(cv2.mean(img_cv)[0] + 0.5)
+    cv2.LUT(img_cv, contrast_brightness_lut(mean, contrast, brightness), dst=img_cv)
+    
+    # 5. 锐度增强
+    cv2.filter2D(img_cv, -1, sharpness_kernel(sharpness), dst=img_cv)
+    
+    if img_cv.ndim == 3:
+        cv2.cvtColor(img_cv, cv2.COLOR_BGR2RGB, dst=img_cv)
+    return Image.fromarray(img_cv)
+
+def enhance_image(img_cv, contrast=1.2, brightness=1.1, sharpness=1.5, denoise='auto'):
+    """
+    对单页图像应用去噪、锐化、对比度、亮度和锐度增强，返回PIL图像
+
+    对比度和亮度合并为一张查找表，锐度增强合并为一个卷积核，
+    都在同一个 uint8 数组上就地完成，不再经过三次 ImageEnhance 各自分配整页图像
+
+    denoise 为去噪档位（见 DENOISE_TIERS），黑白页在 gray 档位下全程按单通道处理
+    """
+    return finish_image(denoise_and_sharpen(img_cv, denoise), contrast, brightness, sharpness)
+
+# 分块处理：相邻分块重叠的像素数，重叠区域线性融合
+TILE_OVERLAP = 32
+# 每个分块额外渲染的边缘像素，供去噪和锐化使用，处理后裁掉
+_TILE_MARGIN = 16
+
+def page_pixel_rect(page, dpi):
+    """整页按 dpi 渲染后的像素范围，与 render_page 的结果一致"""
+    return (page.rect * fitz.Matrix(dpi / 72, dpi / 72)).irect
+
+def render_region(page, dpi, box):
+    """
+    只渲染页面中的一块区域，box=(x0, y0, x1, y1) 为整页渲染后的像素坐标，返回BGR图像
+    """
+    with profile_stage('render'):
+        return _render_region(page, dpi, box)
+
+def _render_region(page, dpi, box):
+    zoom = dpi / 72
+    full = page_pixel_rect(page, dpi)
+    x0, y0, x1, y1 = box
+    # 多渲染一个像素，避免坐标换算的舍入误差
+    clip = fitz.Rect(full.x0 + x0 - 1, full.y0 + y0 - 1, full.x0 + x1 + 1, full.y0 + y1 + 1)
+    clip = clip * fitz.Matrix(1 / zoom, 1 / zoom) & page.rect
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip, colorspace=fitz.csRGB, alpha=False)
+    img_np = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+
+    top = full.y0 + y0 - pix.y
+    left = full.x0 + x0 - pix.x
+    region = img_np[max(top, 0):top + (y1 - y0), max(left, 0):left + (x1 - x0)]
+    # 页面边缘处渲染结果可能少一个像素，复制边缘补齐
+    pad_bottom = (y1 - y0) - region.shape[0] - max(-top, 0)
+    pad_right = (x1 - x0) - region.shape[1] - max(-left, 0)
+    if top < 0 or left < 0 or pad_bottom > 0 or pad_right > 0:
+        region = cv2.copyMakeBorder(region, max(-top, 0), max(pad_bottom, 0), max(-left, 0),
+                                    max(pad_right, 0), cv2.BORDER_REPLICATE)
+    return cv2.cvtColor(region, cv2.COLOR_RGB2BGR)
+
+def tile_boxes(width, height, tile_size, overlap=TILE_OVERLAP):
+    """按行优先顺序切分重叠的分块，返回 (x0, y0, x1, y1) 列表"""
+    step = tile_size - overlap
+    xs = range(0, max(width - overlap, 1), step)
+    ys = range(0, max(height - overlap, 1), step)
+    return [(x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height)) for y0 in ys for x0 in xs]
+
+def choose_page_tier(page, dpi, denoise='auto'):
+    """分块处理时整页使用同一个去噪档位，auto 时只渲染页面中心的一小块来判断"""
+    if denoise != 'auto':
+        return denoise
+    full = page_pixel_rect(page, dpi)
+    size = 512
+    x0 = max(0, (full.width - size) // 2)
+    y0 = max(0, (full.height - size) // 2)
+    box = (x0, y0, min(full.width, x0 + size), min(full.height, y0 + size))
+    return choose_denoise_tier(render_region(page, dpi, box))
+
+def enhance_tile(page, dpi, box, tier):
+    """渲染并处理一个分块（去噪、锐化），分块可以作为独立的并行任务"""
+    full = page_pixel_rect(page, dpi)
+    x0, y0, x1, y1 = box
+    padded = (max(0, x0 - _TILE_MARGIN), max(0, y0 - _TILE_MARGIN),
+              min(full.width, x1 + _TILE_MARGIN), min(full.height, y1 + _TILE_MARGIN))
+    img_cv = denoise_and_sharpen(render_region(page, dpi, padded), tier)
+    return img_cv[y0 - padded[1]:y1 - padded[1], x0 - padded[0]:x1 - padded[0]]
+
+def stitch_tiles(width, height, boxes, tiles, overlap=TILE_OVERLAP):
+    """
+    按 boxes 的顺序拼接分块，和左侧、上方已写入的分块在重叠区域内线性融合，消除接缝
+
+    tiles 可以是生成器，每次只需要一个分块在内存中
+    """
+    ramp = np.linspace(0, 1, overlap + 2, dtype=np.float32)[1:-1]
+    output = None
+    for (x0, y0, x1, y1), tile in zip(boxes, tiles):
+        if output is None:
+            output = np.empty((height, width) + tile.shape[2:], dtype=np.uint8)
+        target = output[y0:y1, x0:x1]
+        left = overlap if x0 > 0 else 0
+        top = overlap if y0 > 0 else 0
+        # 重叠条带以外的部分直接写入
+        target[top:, left:] = tile[top:, left:]
+        if not (left or top):
+            continue
+        weight_x = np.ones(x1 - x0, dtype=np.float32)
+        weight_x[:left] = ramp[:left]
+        weight_y = np.ones(y1 - y0, dtype=np.float32)
+        weight_y[:top] = ramp[:top]
+        # 上方条带和左侧条带，权重从已写入的分块一侧逐渐过渡到当前分块
+        for rows, cols in ((slice(0, top), slice(None)), (slice(top, None), slice(0, left))):
+            weight = weight_y[rows, None] * weight_x[None, cols]
+            if tile.ndim == 3:
+                weight = weight[..., None]
+            old = target[rows, cols].astype(np.float32)
+            target[rows, cols] = old + (tile[rows, cols] - old) * weight + 0.5
+    return output
+
+# 输出图像的编码方式：
+#   png       无损，文件最大
+#   jpeg      彩色JPEG，quality 控制质量
+#   jpeg-gray 灰度JPEG，适合黑白扫描件
+#   bilevel   1位黑白图，CCITT G4 压缩，适合纯文字页
+ENCODINGS = ('png', 'jpeg', 'jpeg-gray', 'bilevel')
+
+def encode_image(img_pil, encoding='png', quality=85):
+    """
+    在内存中编码增强后的页面图像
+
+    返回:
+        tuple: (编码方式, 编码后的数据, 宽, 高)
+    """
+    buffer = io.BytesIO()
+    if encoding == 'png':
+        img_pil.save(buffer, format='PNG')
+    elif encoding == 'jpeg':
+        img_pil.convert('RGB').save(buffer, format='JPEG', quality=quality, optimize=True)
+    elif encoding == 'jpeg-gray':
+        img_pil.convert('L').save(buffer, format='JPEG', quality=quality, optimize=True)
+    elif encoding == 'bilevel':
+        # Otsu 自动阈值二值化后用 CCITT G4 压缩，整页保存为一个条带
+        gray = np.asarray(img_pil.convert('L'))
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        Image.fromarray(binary).convert('1').save(
+            buffer, format='TIFF', compression='group4', tiffinfo={278: img_pil.height})
+        # 从TIFF容器中取出G4压缩数据，直接作为PDF图像流
+        tiff = Image.open(io.BytesIO(buffer.getvalue()))
+        offset, length = tiff.tag_v2[273][0], tiff.tag_v2[279][0]
+        return encoding, buffer.getvalue()[offset:offset + length], img_pil.width, img_pil.height
+    else:
+        raise ValueError(f"不支持的编码方式: {encoding}，可选: {', '.join(ENCODINGS)}")
+    return encoding, buffer.getvalue(), img_pil.width, img_pil.height
+
+def insert_encoded_image(pdf_doc, pdf_page, encoded):
+    """把编码后的图像铺满整页插入，数据直接以字节流传入，不经过临时文件"""
+    encoding, data, width, height = encoded
+    if encoding != 'bilevel':
+        # PNG 和 JPEG 由 fitz 直接识别，JPEG 数据原样写入PDF，不重新编码
+        pdf_page.insert_image(pdf_page.rect, stream=data)
+        return
+
+    # fitz 不能直接写入 CCITT 数据，手动创建图像对象
+    xref = pdf_doc.get_new_xref()
+    pdf_doc.update_object(xref, '<<>>')
+    pdf_doc.update_stream(xref, data, compress=False)
+    for key, value in (
+        ('Type', '/XObject'),
+        ('Subtype', '/Image'),
+        ('Width', str(width)),
+        ('Height', str(height)),
+        ('ColorSpace', '/DeviceGray'),
+        ('BitsPerComponent', '1'),
+        ('Filter', '/CCITTFaxDecode'),
+        ('DecodeParms', f'<</K -1/Columns {width}/Rows {height}/BlackIs1 true>>'),
+    ):
+        pdf_doc.xref_set_key(xref, key, value)
+    pdf_page.insert_image(pdf_page.rect, xref=xref)
+
+class StageCache:
+    """
+    中间结果的磁盘缓存：键由页面内容的哈希和本阶段及之前各阶段的参数计算，
+    只调整后面阶段的参数（对比度、亮度、锐度等）时，渲染和去噪的结果直接读取
+
+    每个结果保存为一个 .npy 文件，读取时更新修改时间；打开缓存时和每次写入后总大小超过 max_bytes 时
+    按修改时间删除最久未使用的结果（读取不增加总大小，全部命中的运行也不会超出上限）。
+    多个工作进程可以共用同一个目录
+    """
+
+    def __init__(self, directory, max_bytes=2 * 1024 ** 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        # 上限可能比上次运行时小，先按新的上限淘汰
+        self.evict()
+
+    @staticmethod
+    def key(parent, stage, **params):
+        """由上一阶段的键（或页面哈希）、阶段名和本阶段参数计算缓存键"""
+        data = json.dumps([parent, stage, params], sort_keys=True)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+    def get(self, key):
+        """读取缓存的图像，没有时返回 None"""
+        path = self._path(key)
+        try:
+            img_cv = np.load(path)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return img_cv
+
+    def put(self, key, img_cv):
+        """先写临时文件再改名，写入后超出大小上限时淘汰最久未使用的结果"""
+        path = self._path(key)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as f:
+            np.save(f, img_cv)
+        os.replace(temp_path, path)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.npy'):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                    total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+def page_fingerprint(page):
+    """页面内容的哈希：页面尺寸、旋转、内容流以及引用的图像和表单，不需要渲染页面"""
+    doc = page.parent
+    digest = hashlib.sha256()
+    digest.update(repr((tuple(page.rect), page.rotation)).encode('utf-8'))
+    digest.update(page.read_contents())
+    for xref in sorted({image[0] for image in page.get_images(full=True)} |
+                       {xobject[0] for xobject in page.get_xobjects()}):
+        digest.update(doc.xref_stream_raw(xref) or b'')
+    return digest.hexdigest()
+
+def process_page(page, dpi=300, encoding='png', quality=85, denoise='auto', tile_size=None,
+                 tile_overlap=TILE_OVERLAP, contrast=1.2, brightness=1.1, sharpness=1.5, cache=None,
+                 tile_results=None):
+    """
+    渲染、增强并编码一页，返回 encode_image 的结果
+
+    tile_size 不为 None 时分块渲染、去噪和锐化，再拼接成整页完成其余增强；
+    cache 为 StageCache 时渲染和去噪、锐化的结果从缓存中读取；tile_results 见 page_tiles
+    """
+    img_cv = local_stages(page, dpi, denoise, tile_size, tile_overlap, cache, tile_results)
+    with profile_stage('enhance'):
+        img_pil = finish_image(img_cv, contrast, brightness, sharpness)
+    with profile_stage('encode'):
+        return encode_image(img_pil, encoding, quality)
+
+def page_tiles(page, dpi, tile_size, tile_overlap=TILE_OVERLAP, denoise='auto', tile_results=None):
+    """
+    切分一页并逐块处理，返回 stitch_tiles 的前四个参数 (宽, 高, 分块, 分块结果)
+
+    tile_results(boxes, tier) 可以替换逐块处理的方式，例如把分块交给进程池
+    """
+    if tile_size <= tile_overlap:
+        raise ValueError(f"分块大小 {tile_size} 必须大于重叠宽度 {tile_overlap}")
+    full = page_pixel_rect(page, dpi)
+    boxes = tile_boxes(full.width, full.height, tile_size, tile_overlap)
+    tier = choose_page_tier(page, dpi, denoise)
+    if tile_results is None:
+        tiles = (enhance_tile(page, dpi, box, tier) for box in boxes)
+    else:
+        tiles = tile_results(boxes, tier)
+    return full.width, full.height, boxes, tiles
+
+def local_stages(page, dpi=300, denoise='auto', tile_size=None, tile_overlap=TILE_OVERLAP, cache=None,
+                 tile_results=None):
+    """
+    渲染、去噪、锐化一页，返回 uint8 图像
+
+    cache 不为 None 时先查找去噪、锐化后的结果，其次查找渲染结果（不分块时），
+    都没有才从头计算，计算结果写入缓存
+    """
+    if cache is not None:
+        render_key = cache.key(page_fingerprint(page), 'render', dpi=dpi)
+        local_key = cache.key(render_key, 'local', denoise=denoise, tile_size=tile_size,
+                              tile_overlap=tile_overlap if tile_size else None)
+        img_cv = cache.get(local_key)
+        if img_cv is not None:
+            return img_cv
+
+    if tile_size:
+        img_cv = stitch_tiles(*page_tiles(page, dpi, tile_size, tile_overlap, denoise, tile_results), tile_overlap)
+    else:
+        img_cv = cache.get(render_key) if cache is not None else None
+        if img_cv is None:
+            img_cv = render_page(page, dpi)
+            if cache is not None:
+                cache.put(render_key, img_cv)
+        img_cv = denoise_and_sharpen(img_cv, denoise)
+
+    if cache is not None:
+        cache.put(local_key, img_cv)
+    return img_cv
+
+# 工作进程中打开的输入文档和参数，由 _init_worker 设置
+_worker_state = {}
+
+def _init_worker(input_pdf_path, options, cache=None, profile=False):
+    """工作进程初始化：每个进程各自打开一次输入文档"""
+    global _profiler
+    # 多进程并行时关闭OpenCV内部的多线程，避免线程数超过CPU核数
+    cv2.setNumThreads(1)
+    _worker_state['pdf'] = fitz.open(input_pdf_path)
+    _worker_state['options'] = options
+    _worker_state['cache'] = cache
+    _profiler = StageProfiler() if profile else None
+
+def _profiled_job(page_index, fn, *args, **kwargs):
+    """在工作进程中执行 fn，返回 (结果, 本次任务的各阶段记录)，没有开启性能分析时记录为 None"""
+    if _profiler is None:
+        return fn(*args, **kwargs), None
+    _profiler.current = page_index
+    result = fn(*args, **kwargs)
+    return result, _profiler.pop(page_index)
+
+def _enhance_page_job(page_index, dpi):
+    """工作进程中按 dpi 处理一页，返回编码后的图像和各阶段记录"""
+    return _profiled_job(page_index, process_page, _worker_state['pdf'][page_index],
+                         **dict(_worker_state['options'], dpi=dpi), cache=_worker_state['cache'])
+
+def _enhance_tile_job(page_index, dpi, box, tier):
+    """工作进程中处理一个分块，返回去噪、锐化后的分块图像和各阶段记录"""
+    return _profiled_job(page_index, enhance_tile, _worker_state['pdf'][page_index], dpi, box, tier)
+
+def _collect_profile(page_index, results, profiler=None):
+    """从工作进程的结果中取出各阶段记录，合并到主进程的 profiler，只产出结果本身"""
+    for result, stages in results:
+        if profiler is not None:
+            profiler.merge(page_index, stages)
+        yield result
+
+def _bounded_map(executor, fn, args_iter, queue_depth):
+    """按提交顺序产出结果，同时在途的任务数不超过 queue_depth"""
+    pending = deque()
+    for args in args_iter:
+        pending.append(executor.submit(fn, *args))
+        if len(pending) >= queue_depth:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def iter_enhanced_pages_parallel(input_pdf_path, page_indices, options, workers=None, queue_depth=None,
+                                 dpis=None, cache=None, profiler=None):
+    """
+    多进程渲染并增强页面，按页码顺序产出 (页码, 编码后的图像)
+
+    dpis 为各页的渲染分辨率（页码 -> dpi），没有列出的页面使用 options['dpi']
+
+    同时在途的页数不超过 queue_depth，已完成但尚未写出的页面也计算在内，
+    因此内存占用有上限，不会因为写出较慢而无限堆积
+
+    options 中设置了 tile_size 时以分块为并行单位：工作进程只处理分块，
+    主进程按顺序拼接并完成整页增强和编码，此时 queue_depth 为同时在途的最大分块数
+
+    profiler 为 StageProfiler 时，工作进程各自记录各阶段的耗时和内存，随结果一起返回并合并
+    """
+    workers = workers or os.cpu_count()
+    queue_depth = queue_depth or workers * 2
+    page_indices = list(page_indices)
+    dpis = dpis or {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(input_pdf_path, options, cache, profiler is not None)) as executor:
+        if not options.get('tile_size'):
+            jobs = ((page_index, dpis.get(page_index, options['dpi'])) for page_index in page_indices)
+            results = _bounded_map(executor, _enhance_page_job, jobs, queue_depth)
+            for page_index, (encoded, stages) in zip(page_indices, results):
+                if profiler is not None:
+                    profiler.merge(page_index, stages)
+                yield page_index, encoded
+            return
+
+        with fitz.open(input_pdf_path) as pdf:
+            for page_index in page_indices:
+                dpi = dpis.get(page_index, options['dpi'])
+
+                def tile_results(boxes, tier):
+                    jobs = ((page_index, dpi, box, tier) for box in boxes)
+                    return _collect_profile(page_index, _bounded_map(executor, _enhance_tile_job, jobs, queue_depth),
+                                            profiler)
+
+                yield page_index, process_page(pdf[page_index], **dict(options, dpi=dpi), cache=cache,
+                                               tile_results=tile_results)
+
+class PageCheckpoint:
+    """
+    断点存储：每完成一页就把编码后的图像单独保存为一个文件，
+    中途出错后重新运行时，已完成的页面直接读取，不再重新增强
+
+    source 标识输入文件，变化时旧的断点全部作废；options 为处理参数，
+    其摘要写在每页的文件名中，同一断点中的页面可以使用不同的参数（用 pages 只重新处理部分页面时）。
+    作废的文件在第一次 save 时才删除，没有写入任何页面就退出时断点保持不变
+    """
+
+    _FILENAME = re.compile(r'(\d+)_([0-9a-f]+)_([\w-]+)_(\d+)x(\d+)\.bin')
+
+    def __init__(self, directory, source, options):
+        self.directory = directory
+        self.settings = {'source': source}
+        self.options_digest = hashlib.sha1(
+            json.dumps(options, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+        try:
+            with open(os.path.join(directory, 'settings.json'), 'r', encoding='utf-8') as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            previous = None
+        self.stale = previous != self.settings
+
+        self.pages = {}
+        if not self.stale:
+            for name in os.listdir(directory):
+                match = self._FILENAME.fullmatch(name)
+                if match:
+                    self.pages[int(match.group(1))] = name
+
+    def is_current(self, page_index):
+        """页面已保存且使用的是当前的处理参数"""
+        name = self.pages.get(page_index)
+        return name is not None and self._FILENAME.fullmatch(name).group(2) == self.options_digest
+
+    def __contains__(self, page_index):
+        return page_index in self.pages
+
+    def load(self, page_index):
+        """读取已保存的页面，返回与 encode_image 相同格式的结果"""
+        name = self.pages[page_index]
+        _, _, encoding, width, height = self._FILENAME.fullmatch(name).groups()
+        with open(os.path.join(self.directory, name), 'rb') as f:
+            return encoding, f.read(), int(width), int(height)
+
+    def save(self, page_index, encoded):
+        """先写临时文件再改名，中途被打断也不会留下不完整的页面"""
+        if self.stale:
+            self._reset()
+        encoding, data, width, height = encoded
+        name = f'{page_index:05d}_{self.options_digest}_{encoding}_{width}x{height}.bin'
+        temp_path = os.path.join(self.directory, name + '.tmp')
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        if page_index in self.pages:
+            os.remove(os.path.join(self.directory, self.pages[page_index]))
+        os.replace(temp_path, os.path.join(self.directory, name))
+        self.pages[page_index] = name
+
+    def _reset(self):
+        """删除作废的断点，写入新的 settings.json"""
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            if name.endswith('.bin'):
+                os.remove(os.path.join(self.directory, name))
+        with open(os.path.join(self.directory, 'settings.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.settings, f, ensure_ascii=False, indent=1)
+        self.stale = False
+
+    def remove(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+def parse_page_ranges(spec, page_count):
+    """
+    解析页码范围，例如 "1-10,15,480-"（页码从1开始），返回从0开始的页码列表
+    """
+    pages = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if '-' in part:
+                start, end = part.split('-', 1)
+                start = int(start) if start.strip() else 1
+                end = int(end) if end.strip() else page_count
+            else:
+                start = end = int(part)
+        except ValueError:
+            raise ValueError(f"页码范围无效: {part}") from None
+        if start < 1 or end > page_count or start > end:
+            raise ValueError(f"页码范围无效: {part}（共 {page_count} 页）")
+        pages.update(range(start - 1, end))
+    return sorted(pages)
+
+def format_page_ranges(page_indices):
+    """parse_page_ranges 的逆操作：把从0开始的页码列表写成 "1-10,15" 的形式"""
+    ranges = []
+    for i in sorted(page_indices):
+        if ranges and ranges[-1][1] == i - 1:
+            ranges[-1][1] = i
+        else:
+            ranges.append([i, i])
+    return ','.join(f'{start + 1}' if start == end else f'{start + 1}-{end + 1}' for start, end in ranges)
+
+# 页面分类阈值
+_SCAN_IMAGE_COVERAGE = 0.6   # 图像覆盖页面的比例达到该值才可能是扫描页
+_SCAN_TEXT_COVERAGE = 0.05   # 可见文字覆盖比例高于该值视为原生文字页
+
+def page_profile(page):
+    """
+    用 fitz 统计页面内容，不渲染页面
+
+    返回:
+        dict: text_coverage 可见文字块面积占比，image_coverage 图像面积占比，
+              image_dpi 面积最大的图像的实际分辨率（没有图像时为 None），
+              largest_image_coverage 面积最大的图像的面积占比
+    """
+    area = abs(page.rect) or 1
+    image_area = 0
+    largest_area = 0
+    image_dpi = None
+    for info in page.get_image_info():
+        bbox = fitz.Rect(info['bbox']) & page.rect
+        if bbox.is_empty:
+            continue
+        image_area += abs(bbox)
+        if abs(bbox) > largest_area:
+            largest_area = abs(bbox)
+            image_dpi = min(info['width'] / (bbox.width / 72), info['height'] / (bbox.height / 72))
+
+    text_area = 0
+    for block in page.get_text('blocks'):
+        if block[6] == 0 and block[4].strip():
+            text_area += abs(fitz.Rect(block[:4]) & page.rect)
+    # 扫描件上OCR生成的隐藏文字层不算可见文字
+    if text_area and image_area / area >= _SCAN_IMAGE_COVERAGE:
+        if all(span['type'] == 3 for span in page.get_texttrace()):
+            text_area = 0
+
+    return {
+        'text_coverage': min(1.0, text_area / area),
+        'image_coverage': min(1.0, image_area / area),
+        'image_dpi': image_dpi,
+        'largest_image_coverage': min(1.0, largest_area / area),
+    }
+
+def is_scanned_page(profile):
+    """图像铺满页面且几乎没有可见文字的页面才需要增强，原生文字、矢量页面原样保留"""
+    return (profile['image_coverage'] >= _SCAN_IMAGE_COVERAGE
+            and profile['text_coverage'] < _SCAN_TEXT_COVERAGE)
+
+# 自适应分辨率的下限，图像分辨率过低时也不低于该值渲染
+_MIN_RENDER_DPI = 72
+
+def page_render_dpi(profile, max_dpi=300):
+    """
+    按页面中面积最大的图像（扫描图像）的实际分辨率渲染，不超过 max_dpi；
+    没有图像或最大的图像没有铺满页面（例如图标、插图）时使用 max_dpi
+    """
+    if profile['image_dpi'] is None or profile['largest_image_coverage'] < _SCAN_IMAGE_COVERAGE:
+        return max_dpi
+    return max(_MIN_RENDER_DPI, min(max_dpi, int(round(profile['image_dpi']))))
+
+# 输出文档每写入多少页就增量保存一次
+OUTPUT_FLUSH_PAGES = 16
+
+def flush_output(pdf_output, temp_path):
+    """
+    把输出文档保存到临时文件（第一次完整保存，之后增量保存）后重新打开，
+    已写入页面的图像数据留在磁盘上，最后保存时才逐个读取；
+    同时清空 MuPDF 的资源缓存，其中解码过的图像也会随页数增长
+    """
+    if pdf_output.name == temp_path:
+        pdf_output.saveIncr()
+    else:
+        pdf_output.save(temp_path)
+    pdf_output.close()
+    fitz.TOOLS.store_shrink(100)
+    return fitz.open(temp_path)
+
+def enhance_pdf_clarity(input_pdf_path, output_pdf_path, dpi=300, workers=1, queue_depth=None,
+                        encoding='png', quality=85, denoise='auto', skip_digital=True,
+                        pages=None, checkpoint_dir=None, keep_checkpoint=False, tile_size=None,
+                        tile_overlap=TILE_OVERLAP, adaptive_dpi=True, contrast=1.2, brightness=1.1,
+                        sharpness=1.5, cache_dir=None, cache_size=2 * 1024 ** 3, profile=None):
+    """
+    提升PDF文件的清晰度
+
+    逐页渲染、增强并写入输出文档，处理完一页再渲染下一页；每写入 OUTPUT_FLUSH_PAGES 页
+    就把输出文档增量保存到临时文件并重新打开，释放内存中已编码的图像，
+    峰值内存主要取决于单页大小，随总页数只有少量增长（页面对象和交叉引用表）
+
+    workers > 1 时使用多进程并行处理页面（None 表示使用全部CPU核），
+    由主进程按页码顺序写入；queue_depth 为同时在途的最大页数，默认为进程数的2倍
+
+    encoding 为输出图像的编码方式（见 ENCODINGS），quality 为JPEG质量，
+    denoise 为去噪档位（见 DENOISE_TIERS）
+
+    skip_digital 为 True 时只增强扫描图像页，已有文字层和矢量图形的原生页面
+    用 insert_pdf 原样复制，既节省时间又保留可搜索的文字
+
+    每增强完一页就保存到断点目录 checkpoint_dir（默认为 "<输出路径>.checkpoint"），
+    出错后重新运行会跳过已完成的页面；成功后删除断点，keep_checkpoint=True 时保留。
+    处理参数改变后完整运行时，断点中用旧参数增强的页面会重新处理。
+    pages 为需要重新处理的页码（从0开始），其余扫描页使用断点中的结果（即使参数不同）；
+    断点中缺少其余扫描页时不写出任何文件，以免用未增强的页面覆盖之前的输出。
+    指定 pages 时始终保留断点，便于之后继续重新处理其他页面
+
+    adaptive_dpi 为 True 时每页按扫描图像的实际分辨率渲染，dpi 作为上限，
+    避免把150dpi的扫描件放大到300dpi后再去噪；为 False 时所有页面都按 dpi 渲染
+
+    tile_size 不为 None 时按 tile_size 像素的分块处理，相邻分块重叠 tile_overlap 像素，
+    去噪和锐化只在分块上进行，高DPI下工作进程的内存占用只与分块大小有关；
+    并行时分块作为独立任务分配给各个进程
+
+    contrast、brightness、sharpness 为对比度、亮度和锐度的增强系数。
+    cache_dir 不为 None 时把渲染和去噪的中间结果缓存在该目录（总大小不超过 cache_size 字节），
+    只调整这三个系数重新运行时不必重新渲染和去噪
+
+    profile 为JSON报告的路径，不为 None 时按页记录 render、denoise、sharpen、enhance、
+    encode、insert 各阶段的耗时和峰值内存，并汇总页数/秒、增强页数/秒、输出的 MB/页
+    和整个运行的峰值内存
+    """
+    global _profiler
     print(f"正在处理PDF文件: {input_pdf_path}")
+    options = {'dpi': dpi, 'encoding': encoding, 'quality': quality, 'denoise': denoise,
+               'contrast': contrast, 'brightness': brightness, 'sharpness': sharpness}
+    if tile_size:
+        options.update(tile_size=tile_size, tile_overlap=tile_overlap)
     
-    # 创建临时目录
-    temp_dir = tempfile.mkdtemp()
+    stat = os.stat(input_pdf_path)
+    checkpoint = PageCheckpoint(
+        checkpoint_dir or output_pdf_path + '.checkpoint',
+        {'input': os.path.abspath(input_pdf_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns},
+        dict(options, adaptive_dpi=adaptive_dpi),
+    )
+    
+    cache = StageCache(cache_dir, cache_size) if cache_dir else None
+    _profiler = StageProfiler() if profile else None
+    started = time.perf_counter()
     
     try:
-        # 将PDF转换为图像
-        print("将PDF转换为图像...")
-        images = convert_from_path(input_pdf_path, dpi=dpi)
+        pdf_input = fitz.open(input_pdf_path)
         
         # 创建新的PDF文档
         pdf_output = fitz.open()
+        temp_path = output_pdf_path + '.tmp'
         
-        for i, img in enumerate(images):
-            print(f"正在增强第 {i+1}/{len(images)} 页...")
-            
-            # 转换为OpenCV格式进行处理
-            img_np = np.array(img)
-            img_cv = cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
-            
-            # 应用图像增强技术
-            # 1. 去噪
-            img_cv = cv2.fastNlMeansDenoisingColored(img_cv, None, 10, 10, 7, 21)
-            
-            # 2. 锐化
-            kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
-            img_cv = cv2.filter2D(img_cv, -1, kernel)
-            
-            # 3. 对比度增强
-            img_pil = Image.fromarray(cv2.cvtColor(img_cv, cv2.COLOR_BGR2RGB))
-            enhancer = ImageEnhance.Contrast(img_pil)
-            img_pil = enhancer.enhance(1.2)
-            
-            # 4. 亮度调整
-            enhancer = ImageEnhance.Brightness(img_pil)
-            img_pil = enhancer.enhance(1.1)
-            
-            # 5. 锐度增强
-            enhancer = ImageEnhance.Sharpness(img_pil)
-            img_pil = enhancer.enhance(1.5)
-            
-            # 保存增强后的图像到临时文件
-            temp_img_path = os.path.join(temp_dir, f"enhanced_{i}.png")
-            img_pil.save(temp_img_path)
+        page_count = pdf_input.page_count
+        profiles = [page_profile(page) for page in pdf_input] if skip_digital or adaptive_dpi else None
+        if skip_digital:
+            scanned = [i for i in range(page_count) if is_scanned_page(profiles[i])]
+            print(f"扫描页 {len(scanned)} 页，原样保留 {page_count - len(scanned)} 页")
+        else:
+            scanned = list(range(page_count))
+        
+        # 各页的渲染分辨率
+        if adaptive_dpi:
+            dpis = {i: page_render_dpi(profiles[i], dpi) for i in scanned}
+        else:
+            dpis = {i: dpi for i in scanned}
+        
+        if pages is None:
+            # 完整运行：跳过断点中按当前参数完成的页面
+            todo = [i for i in scanned if not checkpoint.is_current(i)]
+            if len(todo) < len(scanned):
+                print(f"从断点继续: 已完成 {len(scanned) - len(todo)} 页")
+        else:
+            # 只重新处理指定页面，其余扫描页必须都在断点中（可以是用其他参数增强的）
+            selected = set(pages)
+            todo = [i for i in scanned if i in selected]
+            missing = [i for i in scanned if i not in selected and i not in checkpoint]
+            if missing:
+                print(f"断点 {checkpoint.directory} 中缺少第 {format_page_ranges(missing)} 页，"
+                      f"没有写出任何文件。请先用 --keep-checkpoint 完整运行，或把这些页面一并重新处理")
+                pdf_input.close()
+                return
+        
+        if workers is None or workers > 1:
+            enhanced = iter_enhanced_pages_parallel(input_pdf_path, todo, options, workers, queue_depth, dpis,
+                                                    cache, _profiler)
+        else:
+            enhanced = ((i, process_page(pdf_input[i], **dict(options, dpi=dpis[i]), cache=cache)) for i in todo)
+        
+        scanned = set(scanned)
+        todo = set(todo)
+        for i in range(page_count):
+            if _profiler is not None:
+                _profiler.current = i
+            if i in todo:
+                _, encoded = next(enhanced)
+                checkpoint.save(i, encoded)
+                print(f"已增强第 {i+1}/{page_count} 页 ({dpis[i]} dpi)")
+            elif i in scanned and i in checkpoint:
+                encoded = checkpoint.load(i)
+            else:
+                # 原生页面（或未选中且没有断点的页面）原样复制
+                encoded = None
+                pdf_output.insert_pdf(pdf_input, from_page=i, to_page=i)
             
-            # 将图像添加到PDF
-            pdf_page = pdf_output.new_page(
-                width=img_pil.width,
-                height=img_pil.height
-            )
+            if encoded is not None:
+                # 新页面保持原页面的尺寸，图像铺满整页
+                rect = pdf_input[i].rect
+                with profile_stage('insert'):
+                    pdf_page = pdf_output.new_page(width=rect.width, height=rect.height)
+                    insert_encoded_image(pdf_output, pdf_page, encoded)
             
-            # 将图像插入页面
-            rect = fitz.Rect(0, 0, img_pil.width, img_pil.height)
-            pdf_page.insert_image(rect, filename=temp_img_path)
+            if (i + 1) % OUTPUT_FLUSH_PAGES == 0 and i + 1 < page_count:
+                pdf_output = flush_output(pdf_output, temp_path)
         
-        # 保存PDF
-        pdf_output.save(output_pdf_path)
+        pdf_input.close()
+        
+        # 保存PDF，已增量保存的页面从临时文件中逐个读取
+        pdf_output.save(output_pdf_path, garbage=3, deflate=True)
         pdf_output.close()
         
         print(f"增强后的PDF已保存至: {output_pdf_path}")
         
+        # 按渲染分辨率汇总增强的页面
+        pages_by_dpi = {}
+        for i in sorted(todo):
+            pages_by_dpi.setdefault(dpis[i], []).append(i)
+        for page_dpi, indices in sorted(pages_by_dpi.items()):
+            print(f"  {page_dpi} dpi: {len(indices)} 页 ({format_page_ranges(indices)})")
+        
+        if _profiler is not None:
+            write_profile_report(profile, _profiler, time.perf_counter() - started, page_count, len(todo),
+                                 os.path.getsize(output_pdf_path), input=input_pdf_path, options=options,
+                                 workers=workers)
+        
+        if not keep_checkpoint and pages is None:
+            checkpoint.remove()
+        
     except Exception as e:
         print(f"处理过程中出错: {e}")
-    
+        print(f"已完成的 {len(checkpoint.pages)} 页保存在 {checkpoint.directory}，重新运行将从断点继续")
     finally:
-        # 清理临时文件
-        for file in os.listdir(temp_dir):
+        _profiler = None
+        if os.path.exists(output_pdf_path + '.tmp'):
+            os.remove(output_pdf_path + '.tmp')
+
+def write_profile_report(path, profiler, wall_seconds, page_count, enhanced_count, output_bytes, **summary):
+    """写出JSON性能报告并打印各阶段的总耗时"""
+    # 重置过峰值后 ru_maxrss 也会变小，与各阶段记录的峰值取最大值
+    peaks = [mb for mb in (peak_rss_mb(), profiler.max_peak_rss_mb()) if mb is not None]
+    report = profiler.report(
+        wall_seconds=wall_seconds,
+        page_count=page_count,
+        enhanced_pages=enhanced_count,
+        pages_per_second=page_count / wall_seconds if wall_seconds else None,
+        enhanced_pages_per_second=enhanced_count / wall_seconds if wall_seconds else None,
+        output_bytes=output_bytes,
+        mb_per_page=output_bytes / 1024 ** 2 / page_count if page_count else None,
+        peak_rss_mb=max(peaks) if peaks else None,
+        **summary,
+    )
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    
+    print(f"性能报告已保存至: {path}")
+    for name, seconds in report['stage_seconds'].items():
+        print(f"  {name:>8}: {seconds:8.2f} s")
+    print(f"  {report['pages_per_second'] or 0:.2f} 页/秒（增强 {report['enhanced_pages_per_second'] or 0:.2f} 页/秒），"
+          f"{report['mb_per_page'] or 0:.3f} MB/页")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description='提升PDF文件的清晰度')
+    parser.add_argument('input', nargs='?', default="./卫生统计学_赵耐青.pdf", help='输入PDF路径')
+    parser.add_argument('output', nargs='?', default="./enhanced_卫生统计学_赵耐青.pdf", help='输出PDF路径')
+    parser.add_argument('--dpi', type=int, default=300, help='最大渲染分辨率，各页按扫描图像的实际分辨率渲染')
+    parser.add_argument('--fixed-dpi', action='store_true', help='所有页面都按 --dpi 渲染，不自适应')
+    parser.add_argument('-j', '--workers', type=int, default=1, help='并行进程数，0 表示使用全部CPU核')
+    parser.add_argument('--queue-depth', type=int, help='同时在途的最大页数，默认为进程数的2倍')
+    parser.add_argument('-e', '--encoding', choices=ENCODINGS, default='png', help='输出图像的编码方式')
+    parser.add_argument('-q', '--quality', type=int, default=85, help='JPEG质量（1-95）')
+    parser.add_argument('--denoise', choices=DENOISE_TIERS, default='auto', help='去噪档位，auto 按页面自动选择')
+    parser.add_argument('--contrast', type=float, default=1.2, help='对比度增强系数')
+    parser.add_argument('--brightness', type=float, default=1.1, help='亮度增强系数')
+    parser.add_argument('--sharpness', type=float, default=1.5, help='锐度增强系数')
+    parser.add_argument('--cache-dir', help='渲染和去噪结果的缓存目录，调整增强系数后重新运行时复用')
+    parser.add_argument('--cache-size', type=int, default=2048, help='缓存目录的大小上限（MB）')
+    parser.add_argument('--all-pages', action='store_true', help='所有页面都栅格化增强，不跳过原生文字页')
+    parser.add_argument('--pages', help='只重新处理这些页，例如 "1-10,15,480-"（页码从1开始），'
+                                        '其余扫描页从断点读取')
+    parser.add_argument('--checkpoint-dir', help='断点目录，默认为 "<输出路径>.checkpoint"')
+    parser.add_argument('--tile-size', type=int, help='分块处理的分块边长（像素），适合600dpi等高分辨率，例如 1024')
+    parser.add_argument('--tile-overlap', type=int, default=TILE_OVERLAP, help='相邻分块的重叠像素数')
+    parser.add_argument('--keep-checkpoint', action='store_true', help='完成后保留断点，便于之后用 --pages 重新处理部分页面')
+    parser.add_argument('--profile', metavar='REPORT.json', help='按页记录各阶段的耗时和峰值内存，写出JSON报告')
+
+    args = parser.parse_args()
+    pages = None
+    if args.pages:
+        with fitz.open(args.input) as pdf:
             try:
-                os.remove(os.path.join(temp_dir, file))
-            except:
-                pass
-        try:
-            os.rmdir(temp_dir)
-        except:
-            pass
+                pages = parse_page_ranges(args.pages, pdf.page_count)
+            except ValueError as e:
+                parser.error(f"--pages: {e}")
+    enhance_pdf_clarity(args.input, args.output, dpi=args.dpi, workers=args.workers or None,
+                        queue_depth=args.queue_depth, encoding=args.encoding, quality=args.quality,
+                        denoise=args.denoise, skip_digital=not args.all_pages, pages=pages,
+                        checkpoint_dir=args.checkpoint_dir, keep_checkpoint=args.keep_checkpoint,
+                        tile_size=args.tile_size, tile_overlap=args.tile_overlap, adaptive_dpi=not args.fixed_dpi,
+                        contrast=args.contrast, brightness=args.brightness, sharpness=args.sharpness,
+                        cache_dir=args.cache_dir, cache_size=args.cache_size * 1024 ** 2, profile=args.profile)
 
 if __name__ == "__main__":
-    # 使用示例
-   input_pdf = "./卫生统计学_赵耐青.pdf"  # 替换为您的输入PDF路径
-   output_pdf = "./enhanced_卫生统计学_赵耐青.pdf"  # 输出PDF路径
-   enhance_pdf_clarity(input_pdf, output_pdf, dpi=300)
\ No newline at end of file
+    main()
@@ -0,0 +1,256 @@
+'''
+Author: Diana Tang
+Date: 2026-10-17 10:12:40
+LastEditors: Diana Tang
+Description: 删除不必要折行符的统一核心，TXT、Markdown、DOCX 共用同一个处理循环
+FilePath: /PekingUniversityCode/PekingUniversityPublicHealth/reflow.py
+'''
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# 行尾标点符号集合（main.py 的规则，中英文句读符号）
+PUNCTUATION = frozenset('。！？，、；：,.!?;:')
+
+# 中文排版规则，包含引号、括号、破折号和省略号
+CJK_PUNCTUATION = frozenset('。，！？；：、“”‘’【】（）《》—…．')
+
+def reflow_lines(lines, punctuation=PUNCTUATION, joiner=' ', keep_blank_lines=False, strip=True):
+    """
+    合并行尾没有标点符号的行，逐段产出结果
+
+    参数:
+        lines (iterable): 输入的行（不含换行符）
+        punctuation (frozenset): 行尾标点符号集合，出现在行尾表示段落结束
+        joiner (str): 合并各行时使用的连接符，中文文本一般使用 ''
+        keep_blank_lines (bool): 为 True 时空行作为段落分隔保留在输出中，否则丢弃
+        strip (bool): 为 True 时去掉续行的首尾空白和段落首行的行尾空白，只含空白的行视为空行；
+            为 False 时各行原样拼接，只有空字符串才是空行（test.py 的规则）
+
+    同一段落的各行先收集到列表中，段落结束时只拼接一次，总耗时与文本长度成线性关系
+    """
+    fragments = []
+    for line in lines:
+        # 段落首行保留缩进，后续行去掉首尾空白
+        if strip:
+            line = line.strip() if fragments else line.rstrip()
+        if not line:
+            if keep_blank_lines:
+                if fragments:
+                    yield joiner.join(fragments)
+                    fragments.clear()
+                yield ''
+            continue
+        fragments.append(line)
+        # 行尾有标点符号，段落结束
+        if line[-1] in punctuation:
+            yield joiner.join(fragments)
+            fragments.clear()
+
+    # 最后一行没有标点符号时也要保留
+    if fragments:
+        yield joiner.join(fragments)
+
+# Markdown 中原样输出的行：标题、表格、HTML、分隔线
+_MARKDOWN_VERBATIM = re.compile(r'\s{0,3}(#{1,6}(\s|$)|\||<|([-*_])(\s*\3){2,}\s*$)')
+# Markdown 中单独起段的行：列表项、引用
+_MARKDOWN_ITEM = re.compile(r'\s{0,3}([-*+]\s|\d+[.)]\s|>)')
+_MARKDOWN_FENCE = re.compile(r'\s{0,3}(```|~~~)')
+
+def reflow_markdown_lines(lines, punctuation=PUNCTUATION, joiner=' '):
+    """
+    Markdown 版本：只合并普通段落、列表项和引用中的续行
+
+    代码块、缩进代码、标题、表格等原样输出，空行始终保留，以免破坏 Markdown 的段落结构
+    """
+    run = []
+    in_fence = False
+    for line in lines:
+        fence = _MARKDOWN_FENCE.match(line)
+        verbatim = (in_fence or fence or not line.strip() or line.startswith(('    ', '\t'))
+                    or _MARKDOWN_VERBATIM.match(line))
+        if verbatim or _MARKDOWN_ITEM.match(line):
+            if run:
+                yield from reflow_lines(run, punctuation, joiner)
+                run = []
+            if fence:
+                in_fence = not in_fence
+            if verbatim:
+                yield line.rstrip()
+                continue
+        run.append(line)
+
+    if run:
+        yield from reflow_lines(run, punctuation, joiner)
+
+def read_txt_lines(input_file, buffer_size=1024 * 1024):
+    """逐行读取文本文件，按 str.splitlines 的规则切分，保证与整文件读取结果一致"""
+    with open(input_file, 'r', encoding='utf-8', buffering=buffer_size) as file:
+        for raw_line in file:
+            yield from raw_line.splitlines()
+
+def write_txt_lines(lines, output_file, buffer_size=1024 * 1024):
+    """
+    逐段写出文本文件，段落之间用换行符分隔
+
+    先写临时文件再替换输出文件，lines 可以是逐行读取同一个文件的生成器
+    """
+    temp_path = output_file + '.tmp'
+    try:
+        with open(temp_path, 'w', encoding='utf-8', buffering=buffer_size) as file:
+            separator = ''
+            for line in lines:
+                file.write(separator)
+                file.write(line)
+                separator = '\n'
+        os.replace(temp_path, output_file)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def read_docx_lines(input_file):
+    """
+    读取Word文档的段落，段落内的软回车（<w:br/>）拆分为单独的行
+
+    只提取文字，表格、样式、图片等都会丢失，用于 DOCX -> TXT 等格式转换；
+    DOCX -> DOCX 由 reflow_file 交给 remove_docx_line_breaks 处理
+    """
+    from docx import Document
+
+    doc = Document(input_file)
+    for paragraph in doc.paragraphs:
+        yield from paragraph.text.split('\n')
+
+def write_docx_lines(lines, output_file):
+    """每个合并后的段落写成新建的Word文档中的一个无格式段落"""
+    from docx import Document
+
+    doc = Document()
+    for line in lines:
+        doc.add_paragraph(line)
+    doc.save(output_file)
+
+# 每个任务提取的页数
+PDF_PAGES_PER_JOB = 8
+
+def _pdf_pages_lines(pdf, start, stop):
+    """按阅读顺序提取 [start, stop) 页中文字块的各行，图像块跳过"""
+    lines = []
+    for page_index in range(start, stop):
+        for block in pdf[page_index].get_text('blocks', sort=True):
+            if block[6] == 0:
+                lines.extend(block[4].splitlines())
+    return lines
+
+# 工作进程中打开的PDF文档，由 _init_pdf_worker 设置
+_pdf_worker_state = {}
+
+def _init_pdf_worker(input_file):
+    """工作进程初始化：每个进程各自打开一次输入文档"""
+    import fitz  # PyMuPDF
+
+    _pdf_worker_state['pdf'] = fitz.open(input_file)
+
+def _pdf_lines_job(start, stop):
+    return _pdf_pages_lines(_pdf_worker_state['pdf'], start, stop)
+
+def read_pdf_lines(input_file, workers=None, pages_per_job=PDF_PAGES_PER_JOB, queue_depth=None):
+    """
+    直接从PDF中提取文字块，按页码顺序逐行产出，不需要先手动导出为TXT
+
+    workers 为进程数（None 表示使用全部CPU核，1 表示在当前进程中提取），
+    每 pages_per_job 页为一个任务；同时在途的任务数不超过 queue_depth（默认为进程数的2倍），
+    已提取但尚未写出的文字也计算在内，内存占用与总页数无关
+    """
+    import fitz  # PyMuPDF
+
+    with fitz.open(input_file) as pdf:
+        page_count = pdf.page_count
+        chunks = [(start, min(start + pages_per_job, page_count)) for start in range(0, page_count, pages_per_job)]
+        workers = workers or os.cpu_count()
+        if workers == 1 or len(chunks) <= 1:
+            for start, stop in chunks:
+                yield from _pdf_pages_lines(pdf, start, stop)
+            return
+
+    queue_depth = queue_depth or workers * 2
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_pdf_worker,
+                             initargs=(input_file,)) as executor:
+        pending = deque()
+        for start, stop in chunks:
+            pending.append(executor.submit(_pdf_lines_job, start, stop))
+            if len(pending) >= queue_depth:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+# 文件扩展名 -> (读取函数, 折行合并函数, 写出函数)
+FORMATS = {
+    '.txt': (read_txt_lines, reflow_lines, write_txt_lines),
+    '.md': (read_txt_lines, reflow_markdown_lines, write_txt_lines),
+    '.markdown': (read_txt_lines, reflow_markdown_lines, write_txt_lines),
+    '.docx': (read_docx_lines, reflow_lines, write_docx_lines),
+    '.pdf': (read_pdf_lines, reflow_lines, None),
+}
+
+def register_format(extension, reader, writer, reflow=reflow_lines):
+    """注册新的文件格式，reader(path) 产出行，writer(lines, path) 写出结果"""
+    FORMATS[extension.lower()] = (reader, reflow, writer)
+
+def _is_docx(path):
+    return os.path.splitext(path)[1].lower() == '.docx'
+
+def _get_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f"不支持的文件格式: {path}")
+    return FORMATS[extension]
+
+def reflow_file(input_file, output_file, **options):
+    """
+    按扩展名选择读取和写出方式，删除文件中不必要的折行符
+
+    输入和输出可以是不同格式，例如 DOCX -> TXT；options 传给折行合并函数。
+    DOCX -> DOCX 只删除段落内不必要的软回车，段落、表格、样式和图片保持不变；
+    只支持 punctuation 选项
+    """
+    if _is_docx(input_file) and _is_docx(output_file):
+        remove_docx_line_breaks(input_file, output_file, options.get('punctuation', PUNCTUATION))
+        return
+    reader, reflow, _ = _get_format(input_file)
+    _, _, writer = _get_format(output_file)
+    if writer is None:
+        raise ValueError(f"不支持写出该格式: {output_file}")
+    writer(reflow(reader(input_file), **options), output_file)
+
+def _remove_docx_breaks(block, punctuation):
+    """删除块内各段落中前文没有标点结尾的软回车；分页符、分栏符保留"""
+    from docx_stream import w, iter_paragraph_content
+
+    text_tag, br_tag, cr_tag, type_attr = w('t'), w('br'), w('cr'), w('type')
+    for paragraph in list(block.iter(w('p'))):
+        last_char = None
+        for elem in iter_paragraph_content(paragraph):
+            if elem.tag == text_tag:
+                text = (elem.text or '').rstrip()
+                if text:
+                    last_char = text[-1]
+            elif elem.tag == cr_tag or (elem.tag == br_tag and elem.get(type_attr, 'textWrapping') == 'textWrapping'):
+                # 段首的软回车没有前文可以判断，保留
+                if last_char is not None and last_char not in punctuation:
+                    elem.getparent().remove(elem)
+
+def remove_docx_line_breaks(input_file, output_file, punctuation=PUNCTUATION):
+    """
+    流式删除Word文档中不必要的软回车（<w:br/>），不构建 python-docx 对象模型
+
+    用 lxml iterparse 逐个段落、表格处理 word/document.xml，只删除前文没有标点结尾的软回车，
+    压缩包中的其他成员逐字节原样复制，不重新压缩
+    """
+    from docx_stream import rewrite_docx, rewrite_xml_stream
+
+    def transform(src, dst):
+        rewrite_xml_stream(src, dst, lambda block: _remove_docx_breaks(block, punctuation), depth=2)
+
+    rewrite_docx(input_file, output_file, {'word/document.xml': transform})
@@ -5,41 +5,15 @@ LastEditors: Diana Tang
 Description: some description
 FilePath: /PekingUniversityCode/PekingUniversityPublicHealth/test.py
 '''
+from reflow import CJK_PUNCTUATION, reflow_lines
+
+# 原有的标点符号集合：中文标点中不含弯引号，另外把英文双引号视为段落结束
+PUNCTUATION = (CJK_PUNCTUATION - frozenset('“”‘’')) | frozenset('"')
+
 def process_text(text):
-    # 分割成行
+    # 分割成行，各行原样拼接不加空格，空行保留为段落分隔
     lines = text.split('\n')
-    
-    # 中文标点符号集合
-    punctuation = {'。', '，', '！', '？', '；', '：', '、', '"', '"', ''', ''', '【', '】', '（', '）', '《', '》', '—', '…', '．'}
-    
-    result = []
-    temp_line = ''
-    
-    for line in lines:
-        if not line:  # 跳过空行
-            if temp_line:
-                result.append(temp_line)
-                temp_line = ''
-            result.append('')
-            continue
-            
-        # 如果当前行末尾有标点符号
-        if line[-1] in punctuation:
-            if temp_line:
-                temp_line += line
-                result.append(temp_line)
-                temp_line = ''
-            else:
-                result.append(line)
-        else:
-            # 如果没有标点符号，累积到临时行
-            temp_line += line
-    
-    # 处理最后一行
-    if temp_line:
-        result.append(temp_line)
-    
-    return '\n'.join(result)
+    return '\n'.join(reflow_lines(lines, PUNCTUATION, joiner='', keep_blank_lines=True, strip=False))
 
 # 测试文本
 text = """作为一名大学研究者，我的专业